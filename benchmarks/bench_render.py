@@ -0,0 +1,210 @@
+'''Frame throughput of the PBR and raytracing cameras on a standalone GL context, reported as JSON.
+
+Each case runs in its own process (so that its peak memory is its own), renders `--warmup` frames, then
+measures `--frames` frames, with the mobjects rotating and the camera orbiting so that the geometry is
+updated and uploaded every frame. Compare the output of two commits to spot regressions.
+
+    python benchmarks/bench_render.py [--cases sphere_hires bloom_off ...] [--backend egl] [--output result.json]
+'''
+
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from contextlib import contextmanager
+
+os.environ.setdefault("PYGLET_HEADLESS", "1") # manimlib imports pyglet, which needs no display then
+
+import numpy as np
+import trimesh
+from PIL import Image
+from manimlib import *
+from manimgl_3d import *
+from manimgl_3d.utils.gl_resources import gl_resources
+
+CASES = (
+    "sphere_hires",     # SpherePBR, 512x256 vertices
+    "square_displaced", # SquarePBR, 1024x1024 vertices with a height map
+    "model_large",      # ModelPBR, icosphere of 327k faces
+    "many_lights",      # 256 point lights over a grid of spheres
+    "instanced_10k",    # InstancedPBR, 10000 small spheres in one draw call
+    "bloom_on",         # the same scene with and without bloom
+    "bloom_off",
+    "rt_scene",         # RTScene's camera, raytraced spheres and a cube
+)
+
+
+def make_height_map(path: str, size: int = 1024) -> str:
+    rng = np.random.default_rng(0)
+    noise = rng.random((size // 16, size // 16))
+    image = Image.fromarray((noise * 255).astype(np.uint8)).resize((size, size), Image.BICUBIC)
+    image.save(path)
+    return path
+
+def make_model(path: str, subdivisions: int = 7) -> str:
+    trimesh.creation.icosphere(subdivisions=subdivisions).export(path)
+    return path
+
+def make_lit_grid(n_lights: int):
+    spheres = [SpherePBR(radius=0.4, resolution=(64, 32)).move_to([x, y, 0]) for x in range(-3, 4) for y in range(-2, 3)]
+    rng = np.random.default_rng(0)
+    lights = []
+    for _ in range(n_lights):
+        light = PointLight(np.array([*rng.uniform([-4, -3], [4, 3]), rng.uniform(0.5, 2)]), light_radius=rng.uniform(1, 2))
+        light.set_light_color(rng.uniform(1, 20, 3))
+        lights.append(light)
+    return spheres, lights
+
+def build_case(name: str, tmpdir: str):
+    '''Returns (camera config, animated mobjects, other mobjects).'''
+    key_light = PointLight(np.array([2., 2., 5.]))
+    key_light.set_light_color(np.array([200., 200., 200.]))
+    if name == "sphere_hires":
+        return {}, [SpherePBR(resolution=(512, 256))], [key_light]
+    if name == "square_displaced":
+        material = PBRMaterial(albedo=color_to_rgb(GREY), roughness=0.6, height=make_height_map(os.path.join(tmpdir, "height.png")), height_scale=0.3)
+        return {}, [SquarePBR(resolution=(1024, 1024), material=material).scale(3)], [key_light]
+    if name == "model_large":
+        return {}, [ModelPBR(make_model(os.path.join(tmpdir, "model.obj"))).scale(2)], [key_light]
+    if name == "many_lights":
+        spheres, lights = make_lit_grid(256)
+        return {}, spheres, lights
+    if name == "instanced_10k":
+        offsets = np.random.default_rng(0).uniform(-3, 3, (10000, 3))
+        return {}, [InstancedPBR(SpherePBR(radius=0.05, resolution=(16, 8)), offsets)], [key_light]
+    if name in ("bloom_on", "bloom_off"):
+        spheres, lights = make_lit_grid(8)
+        return {"bloom": name == "bloom_on"}, spheres, lights
+    if name == "rt_scene":
+        return {}, [Cube(color=RED).shift(OUT * 2)], [SphereRT(ORIGIN, 1), SphereRT(RIGHT * 2, 1)]
+    raise ValueError(f"Unknown case {name}")
+
+@contextmanager
+def time_method(classes, name: str, timings: list):
+    '''Adds the time spent in `cls.name` to `timings[0]` while the block runs.'''
+    originals = {cls: cls.__dict__[name] for cls in classes}
+    def wrap(func):
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                timings[0] += time.perf_counter() - start
+        return wrapper
+    for cls, func in originals.items():
+        setattr(cls, name, wrap(func))
+    try:
+        yield
+    finally:
+        for cls, func in originals.items():
+            setattr(cls, name, func)
+
+def run_case(name: str, width: int, height: int, frames: int, warmup: int, backend: str | None) -> dict:
+    start = time.perf_counter()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        camera_config, animated, others = build_case(name, tmpdir)
+        is_rt = name == "rt_scene"
+        camera_class = RTCamera if is_rt else PBRCamera
+        camera = camera_class(pixel_width=width, pixel_height=height, standalone_backend=backend, gpu_timing=True, **camera_config)
+        if not is_rt:
+            camera.prefetch_materials([m.material for m in animated])
+        setup_seconds = time.perf_counter() - start
+
+        shader_data_seconds = [0.0]
+        upload_bytes = 0
+        with time_method((SurfacePBR, ModelPBR, InstancedPBR, Surface), "get_shader_data", shader_data_seconds):
+            for i in range(warmup + frames):
+                if i == warmup:
+                    shader_data_seconds[0] = 0.0
+                    upload_bytes = 0
+                    frame_start = time.perf_counter()
+                for mobject in animated:
+                    mobject.rotate(0.01, axis=UP)
+                camera.frame.increment_theta(0.005)
+                camera.clear()
+                if is_rt:
+                    camera.capture(animated, others)
+                else:
+                    camera.capture(*animated, *others)
+                    upload_bytes += camera.buffer_cache.upload_bytes
+                camera.ctx.finish()
+        seconds = time.perf_counter() - frame_start
+        if name == "many_lights": # the lights have short ranges, so each tile should only evaluate a few of them
+            light_grid = camera.light_grid
+            assert light_grid.mean_tile_light_count < light_grid.light_count / 2, \
+                f"light culling ineffective: {light_grid.mean_tile_light_count:.1f} of {light_grid.light_count} lights per tile"
+
+        result = {
+            "case": name,
+            "renderer": camera.ctx.info["GL_RENDERER"],
+            "frames": frames,
+            "fps": frames / seconds,
+            "ms_per_frame": 1000 * seconds / frames,
+            "get_shader_data_ms_per_frame": 1000 * shader_data_seconds[0] / frames,
+            "upload_bytes_per_frame": None if is_rt else upload_bytes / frames,
+            "gpu_ms": camera.get_gpu_timings(average=True),
+            "gl_bytes": gl_resources.get_report(camera.ctx)["nbytes"],
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, # KB on Linux
+            "setup_seconds": setup_seconds,
+        }
+        if is_rt:
+            camera.release_rt_resources()
+        else:
+            result["draw_stats"] = dict(camera.draw_stats)
+            result["light_stats"] = {
+                "lights": camera.light_grid.light_count,
+                "culled": int(camera.light_grid.culled_light_count),
+                "mean_per_tile": camera.light_grid.mean_tile_light_count,
+            }
+            camera.release_pbr_resources()
+    return result
+
+def get_git_commit() -> str | None:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=CASES)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--backend", default=None, help="standalone context backend, e.g. egl on headless Linux")
+    parser.add_argument("--output", default=None, help="JSON file to write, stdout if not given")
+    args = parser.parse_args()
+
+    report = {
+        "commit": get_git_commit(),
+        "python": sys.version.split()[0],
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "settings": {key: getattr(args, key) for key in ("width", "height", "frames", "warmup", "backend")},
+        "results": [],
+    }
+    context = multiprocessing.get_context("spawn")
+    for name in args.cases:
+        with context.Pool(1) as pool: # a fresh process per case, so that the peak memory is its own
+            result = pool.apply(run_case, (name, args.width, args.height, args.frames, args.warmup, args.backend))
+        print(f"{name:>18} {result['fps']:>8.2f} fps  {result['get_shader_data_ms_per_frame']:>8.2f} ms get_shader_data", file=sys.stderr)
+        report["results"].append(result)
+
+    text = json.dumps(report, indent=2)
+    if args.output is None:
+        print(text)
+    else:
+        with open(args.output, "w") as file:
+            file.write(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+'''Throughput of compute_tangent_frames on large meshes, against the previous implementation
+(one np.linalg.inv per face, np.add.at accumulation).
+
+    python benchmarks/bench_tangents.py [--faces 100000 1000000 4000000] [--repeat 3]
+'''
+
+import os
+import argparse
+import time
+import tracemalloc
+
+os.environ.setdefault("PYGLET_HEADLESS", "1") # importing manimgl_3d imports manimlib and pyglet, which needs no display then
+
+import numpy as np
+
+from manimgl_3d.utils.model_utils import compute_tangent_frames, TANGENT_CHUNK_SIZE
+
+
+def make_grid_mesh(n_faces: int):
+    '''A wavy square grid with about `n_faces` triangles and uvs following the grid.'''
+    k = max(1, int(np.sqrt(n_faces / 2)))
+    u, v = np.meshgrid(np.linspace(0, 1, k + 1), np.linspace(0, 1, k + 1), indexing='ij')
+    u, v = u.ravel(), v.ravel()
+    vertices = np.stack([u, v, 0.05 * np.sin(20 * u) * np.cos(20 * v)], axis=-1)
+    normals = np.zeros_like(vertices)
+    normals[:, 2] = 1.0
+    tex_coords = np.stack([u, v], axis=-1)
+
+    i, j = np.meshgrid(np.arange(k), np.arange(k), indexing='ij')
+    a = (i * (k + 1) + j).ravel()
+    b, c, d = a + 1, a + k + 1, a + k + 2
+    faces = np.concatenate([np.stack([a, c, b], -1), np.stack([b, c, d], -1)])
+    return vertices, tex_coords, normals, faces
+
+def reference_compute_tangents(vertices, tex_coords, normals, face_indices):
+    index1, index2, index3 = face_indices.transpose()
+    mat_xyz = np.stack((vertices[index2] - vertices[index1], vertices[index3] - vertices[index1]), axis=-1)
+    mat_uv = np.stack((tex_coords[index2] - tex_coords[index1], tex_coords[index3] - tex_coords[index1]), axis=-1)
+    tangent_per_face = (mat_xyz @ np.linalg.inv(mat_uv))[:, :, 0]
+    tangent_per_vertex = np.zeros_like(vertices)
+    for index in (index1, index2, index3):
+        np.add.at(tangent_per_vertex, index, tangent_per_face)
+    tangent_per_vertex -= np.sum(tangent_per_vertex * normals, axis=1, keepdims=True) * normals
+    return tangent_per_vertex
+
+def measure(func, args, repeat: int):
+    best = np.inf
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return best, peak
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--faces", type=int, nargs="+", default=[100_000, 1_000_000, 4_000_000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--reference-limit", type=int, default=1_000_000, help="skip the slow reference above this face count")
+    args = parser.parse_args()
+
+    print(f"chunk size: {TANGENT_CHUNK_SIZE} faces")
+    print(f"{'faces':>10} {'impl':>10} {'seconds':>9} {'Mfaces/s':>9} {'peak MB':>9}")
+    for n_faces in args.faces:
+        mesh = make_grid_mesh(n_faces)
+        n = len(mesh[3])
+        impls = [("vectorized", compute_tangent_frames)]
+        if n <= args.reference_limit:
+            impls.append(("reference", reference_compute_tangents))
+        for name, func in impls:
+            seconds, peak = measure(func, mesh, args.repeat)
+            print(f"{n:>10} {name:>10} {seconds:>9.3f} {n / seconds / 1e6:>9.2f} {peak / 2**20:>9.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -17,6 +17,7 @@ class TestPBR(PBRScene):
         surface = SurfacePBR(
             material = material_blue,
             uv_func = lambda u, v : np.array([u, v, (np.sin(u) + np.sin(v))/2]),
+            vectorized_uv_func = True,
             u_range = (-20, 20),
             v_range = (-20, 20),
             resolution = (100, 100)
@@ -32,4 +32,62 @@ class MyCameraFrame(MobjectShaderCompatibilityMixin, CameraFrame):
 
         self.view_matrix = np.dot(scale_mat, np.dot(rotation, shift))
 
-        return self.view_matrix
\ No newline at end of file
+        return self.view_matrix
+
+    def get_relative_focal_distance(self) -> float:
+        return self.get_focal_distance() / self.get_scale() # FIXME: not sure why unscale it, but it just works!
+
+    def get_clip_coordinates(self, points: np.ndarray) -> np.ndarray:
+        """
+        Maps points of shape (n, 3) into clip space, shape (n, 4), in exactly the
+        same way as emit_gl_Position does in the PBR vertex shader.
+        """
+        x_scale = 2.0 / FRAME_HEIGHT / ASPECT_RATIO
+        y_scale = 2.0 / FRAME_HEIGHT
+
+        view_matrix = self.get_view_matrix()
+        result = np.dot(points, view_matrix[:3, :3].T) + view_matrix[:3, 3]
+        result = np.hstack([result, np.ones((len(result), 1))])
+
+        # Essentially a projection matrix
+        result[:, 0] *= x_scale
+        result[:, 1] *= y_scale
+        result[:, 2] /= self.get_relative_focal_distance()
+        result[:, 3] = 1.0 - result[:, 2]
+
+        # Flip and scale to prevent premature clipping
+        result[:, 2] *= -0.1
+        return result
+
+    @staticmethod
+    def get_box_corners(box_min: np.ndarray, box_max: np.ndarray, margin: float = 0.0) -> np.ndarray:
+        return np.array([
+            [x, y, z]
+            for x in (box_min[0] - margin, box_max[0] + margin)
+            for y in (box_min[1] - margin, box_max[1] + margin)
+            for z in (box_min[2] - margin, box_max[2] + margin)
+        ])
+
+    def is_box_in_view(self, box_min: np.ndarray, box_max: np.ndarray, margin: float = 0.0) -> bool:
+        """
+        Conservative frustum test of an axis aligned box (grown by margin): False only if
+        all of its corners lie beyond the same clip plane, so that nothing of it can be drawn.
+        """
+        clip = self.get_clip_coordinates(self.get_box_corners(box_min, box_max, margin))
+        w = clip[:, 3]
+        for axis in range(3):
+            if (clip[:, axis] > w).all() or (clip[:, axis] < -w).all():
+                return False
+        return True
+
+    def get_projected_extent(self, box_min: np.ndarray, box_max: np.ndarray) -> np.ndarray:
+        """
+        Width and height of the projection of an axis aligned box in normalized device
+        coordinates (2 spans the whole frame), infinite if the box reaches the camera plane.
+        """
+        clip = self.get_clip_coordinates(self.get_box_corners(box_min, box_max))
+        w = clip[:, 3]
+        if (w <= 1e-6).any():
+            return np.array([np.inf, np.inf])
+        ndc = clip[:, :2] / w[:, None]
+        return ndc.max(axis=0) - ndc.min(axis=0)
@@ -0,0 +1,130 @@
+import queue
+import threading
+import numpy as np
+from typing import Callable, List, Optional, Tuple
+from manimlib import SceneFileWriter, Camera
+
+
+class FrameConverter:
+    '''Converts raw frames into the format the movie pipe expects: 8-bit RGBA, bottom row first.
+
+    `channel_order` is the order of the source channels (e.g. "BGRA"), `bit_depth` their size (8 for bytes,
+    16 for half floats in [0, 1]), and `flip` tells whether the source rows are stored top row first.'''
+
+    def __init__(self, pixel_shape: Tuple[int, int], *, flip: bool = False, channel_order: str = "RGBA", bit_depth: int = 8):
+        self.pixel_shape = pixel_shape
+        self.flip = flip
+        self.channel_indices = [channel_order.index(c) for c in "RGBA"]
+        self.bit_depth = bit_depth
+
+    def is_identity(self) -> bool:
+        return not self.flip and self.channel_indices == [0, 1, 2, 3] and self.bit_depth == 8
+
+    def __call__(self, raw_bytes: bytes) -> bytes:
+        if self.is_identity():
+            return raw_bytes
+        width, height = self.pixel_shape
+        frame = np.frombuffer(raw_bytes, dtype=np.float16 if self.bit_depth == 16 else np.uint8).reshape(height, width, 4)
+        if self.flip:
+            frame = frame[::-1]
+        if self.channel_indices != [0, 1, 2, 3]:
+            frame = frame[..., self.channel_indices]
+        if self.bit_depth == 16:
+            frame = np.round(np.clip(frame.astype(np.float32), 0.0, 1.0) * 255.0).astype(np.uint8)
+        return np.ascontiguousarray(frame).tobytes()
+
+
+class FrameWriterThread:
+    '''Consumes frames from a bounded queue on a background thread, so that rendering the next frame
+    overlaps converting and encoding the previous ones. `put` blocks while the queue is full (backpressure),
+    and an error raised by the writer is raised again by the next `put` or `close`.'''
+
+    def __init__(self, write: Callable[[bytes], None], convert: Optional[Callable[[bytes], bytes]] = None, queue_size: int = 8):
+        self.write = write
+        self.convert = convert
+        self.queue: queue.Queue = queue.Queue(maxsize=max(1, queue_size))
+        self.error: Optional[BaseException] = None
+        self.thread = threading.Thread(target=self.run, name="manimgl_3d_frame_writer", daemon=True)
+        self.thread.start()
+
+    def run(self) -> None:
+        while True:
+            raw_bytes = self.queue.get()
+            if raw_bytes is None:
+                return
+            if self.error is not None:
+                continue # drain the queue so that the scene thread never blocks
+            try:
+                self.write(raw_bytes if self.convert is None else self.convert(raw_bytes))
+            except BaseException as error:
+                self.error = error
+
+    def raise_error(self) -> None:
+        if self.error is not None:
+            raise RuntimeError("Writing a frame failed.") from self.error
+
+    def put(self, raw_bytes: bytes) -> None:
+        self.raise_error()
+        self.queue.put(raw_bytes)
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join()
+        self.raise_error()
+
+
+class StreamingSceneFileWriter(SceneFileWriter):
+    '''SceneFileWriter handing the frames to a FrameWriterThread instead of writing them on the scene thread.'''
+
+    CONFIG = {
+        "frame_queue_size": 8,  # frames waiting to be written at most, 0 writes them on the scene thread
+        # format of the frames read from the camera, converted before writing (see FrameConverter)
+        "frame_flip": False,
+        "frame_channel_order": "RGBA",
+        "frame_bit_depth": 8,
+    }
+
+    def __init__(self, scene, **kwargs):
+        super().__init__(scene, **kwargs)
+        self.frame_writer_thread: Optional[FrameWriterThread] = None
+        self.frame_converter: Optional[FrameConverter] = None # used when the frames are written on the scene thread
+
+    def get_frame_dtype(self) -> str:
+        return 'f2' if self.frame_bit_depth == 16 else 'f1'
+
+    def get_frame_converter(self) -> Optional[FrameConverter]:
+        converter = FrameConverter(
+            self.scene.camera.get_pixel_shape(),
+            flip=self.frame_flip,
+            channel_order=self.frame_channel_order,
+            bit_depth=self.frame_bit_depth
+        )
+        return None if converter.is_identity() else converter
+
+    def open_movie_pipe(self, file_path: str) -> None:
+        super().open_movie_pipe(file_path)
+        self.frame_converter = self.get_frame_converter()
+        if self.frame_queue_size > 0:
+            self.frame_writer_thread = FrameWriterThread(self.writing_process.stdin.write, self.frame_converter, self.frame_queue_size)
+
+    def read_frames(self, camera: Camera) -> List[bytes]:
+        return [camera.get_raw_fbo_data(self.get_frame_dtype())]
+
+    def write_frame(self, camera: Camera) -> None:
+        if self.write_to_movie:
+            self.write_raw_frames(self.read_frames(camera))
+
+    def write_raw_frames(self, frames: List[bytes]) -> None:
+        for raw_bytes in frames:
+            if self.frame_writer_thread is not None:
+                self.frame_writer_thread.put(raw_bytes)
+            else:
+                self.writing_process.stdin.write(raw_bytes if self.frame_converter is None else self.frame_converter(raw_bytes))
+            if self.has_progress_display:
+                self.progress_display.update()
+
+    def close_movie_pipe(self) -> None:
+        if self.frame_writer_thread is not None:
+            self.frame_writer_thread.close()
+            self.frame_writer_thread = None
+        super().close_movie_pipe()
@@ -0,0 +1,107 @@
+import ctypes
+import numpy as np
+import moderngl
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from OpenGL.GL import (
+    glGenQueries, glDeleteQueries, glBeginQuery, glEndQuery, glGetQueryObjectiv,
+    GL_TIME_ELAPSED, GL_QUERY_RESULT, GL_QUERY_RESULT_AVAILABLE,
+)
+from OpenGL.raw.GL.VERSION.GL_3_3 import glGetQueryObjectui64v # the wrapped one can't allocate 64 bit outputs
+
+# colors of the passes in the overlay, cycled
+OVERLAY_COLORS = [
+    (0.90, 0.30, 0.25), (0.95, 0.75, 0.20), (0.35, 0.75, 0.35),
+    (0.25, 0.55, 0.95), (0.65, 0.40, 0.90), (0.90, 0.90, 0.90),
+]
+
+
+class GPUTimer:
+    '''Per-pass GPU timings of each frame, measured with GL timer queries.
+
+    Each pass of a frame is wrapped in `section(name)`. The results are only read back once the GPU made them
+    available, usually a frame or two later, so timing never stalls the pipeline; after `frames_in_flight`
+    frames, the oldest one is waited for. Timings are in milliseconds. The first frame is skipped, since it
+    includes the uploads and the warm-up of the driver.'''
+
+    def __init__(self, ctx: moderngl.Context, frames_in_flight: int = 3, history: int = 60):
+        self.ctx = ctx
+        self.frames_in_flight = max(1, frames_in_flight)
+        self.free_queries: List[int] = []
+        self.current: List[Tuple[str, int]] = []    # (pass, query) of the frame being recorded
+        self.pending: deque = deque()               # frames waiting for their results, oldest first
+        self.history: Dict[str, deque] = {}
+        self.history_size = history
+        self.last_timings: Dict[str, float] = {}
+        self.n_frames = 0   # frames whose results came back
+
+    def get_query(self) -> int:
+        if not self.free_queries:
+            self.free_queries.extend(int(query) for query in np.atleast_1d(glGenQueries(8)))
+        return self.free_queries.pop()
+
+    @contextmanager
+    def section(self, name: str):
+        '''Times the GL commands issued inside the block. Sections can't be nested.'''
+        query = self.get_query()
+        glBeginQuery(GL_TIME_ELAPSED, query)
+        try:
+            yield
+        finally:
+            glEndQuery(GL_TIME_ELAPSED)
+            self.current.append((name, query))
+
+    def end_frame(self) -> None:
+        if self.current:
+            self.pending.append(self.current)
+            self.current = []
+        while self.pending and (len(self.pending) > self.frames_in_flight or self.is_available(self.pending[0])):
+            self.collect(self.pending.popleft())
+
+    @staticmethod
+    def is_available(frame: List[Tuple[str, int]]) -> bool:
+        return all(glGetQueryObjectiv(query, GL_QUERY_RESULT_AVAILABLE) for _, query in frame)
+
+    def collect(self, frame: List[Tuple[str, int]]) -> None:
+        timings: Dict[str, float] = {}
+        result = ctypes.c_uint64(0)
+        for name, query in frame:
+            glGetQueryObjectui64v(query, GL_QUERY_RESULT, ctypes.byref(result)) # waits if not available yet
+            timings[name] = timings.get(name, 0.0) + result.value / 1e6
+            self.free_queries.append(query)
+        self.n_frames += 1
+        if self.n_frames == 1:
+            return
+        self.last_timings = timings
+        for name, value in timings.items():
+            self.history.setdefault(name, deque(maxlen=self.history_size)).append(value)
+
+    def get_timings(self) -> Dict[str, float]:
+        '''Milliseconds spent in each pass during the last frame whose results came back.'''
+        return dict(self.last_timings)
+
+    def get_average_timings(self) -> Dict[str, float]:
+        '''Rolling average over the last `history` frames, in milliseconds.'''
+        return {name: sum(values) / len(values) for name, values in self.history.items() if values}
+
+    def draw_overlay(self, fbo: moderngl.Framebuffer, budget_ms: float, height: int = 8) -> None:
+        '''Draws the average timings as a stacked bar along the bottom of `fbo`, one color per pass,
+        the full width standing for `budget_ms`.'''
+        width = fbo.viewport[2]
+        fbo.clear(0.0, 0.0, 0.0, 1.0, viewport=(0, 0, width, height))
+        x = 0
+        for i, (name, value) in enumerate(self.get_average_timings().items()):
+            bar = min(int(round(value / budget_ms * width)), width - x)
+            if bar > 0:
+                fbo.clear(*OVERLAY_COLORS[i % len(OVERLAY_COLORS)], 1.0, viewport=(x, 0, bar, height))
+            x += bar
+
+    def release(self) -> None:
+        for frame in self.pending:
+            self.free_queries.extend(query for _, query in frame)
+        self.free_queries.extend(query for _, query in self.current)
+        if self.free_queries:
+            glDeleteQueries(len(self.free_queries), np.array(self.free_queries, dtype=np.uint32))
+        self.free_queries, self.current, self.pending = [], [], deque()
@@ -1,3 +1,4 @@
 from .pbr_scene import *
 from .surface_pbr import *
-from .material import *
\ No newline at end of file
+from .material import *
+from .render_farm import *
\ No newline at end of file
@@ -0,0 +1,190 @@
+import weakref
+import numpy as np
+import moderngl
+from manimlib import Mobject
+
+from manimgl_3d.utils.gl_resources import track_gl
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from manimgl_3d.pbr.pbr_scene import PBRCamera
+
+
+class PBRBufferCache:
+    '''Keeps the vbo/ibo/vao of every PBR mobject alive across frames.
+
+    Each shader attribute (point, normal, tangent, tex_coords) lives in its own vbo, so that only the
+    attributes whose source arrays in `mobject.data` changed (by their versions, see VersionedData) are
+    re-uploaded. The source arrays of every attribute are declared by `mobject.shader_data_sources`; if a
+    mobject doesn't declare them, every attribute is assumed to depend on every data array.
+
+    Instanced mobjects (see InstancedPBR) also have per-instance attributes, declared by `mobject.instance_dtype`,
+    read from `mobject.get_instance_data()` and stepped once per instance.'''
+
+    def __init__(self, ctx: moderngl.Context):
+        self.ctx = ctx
+        self.entries: dict[int, dict] = {}  # id(mobject) -> entry
+        self.used_ids: set[int] = set()
+        self.upload_bytes = 0               # bytes uploaded during the current frame
+
+    # Frame life cycle
+
+    def begin_frame(self) -> None:
+        self.used_ids = set()
+        self.upload_bytes = 0
+
+    def keep(self, mobject: Mobject) -> None:
+        '''Keeps the buffers of a mobject which isn't drawn this frame (e.g. culled), without updating them.'''
+        self.used_ids.add(id(mobject))
+
+    def end_frame(self) -> None:
+        # mobjects which were not rendered this frame (removed from the scene, or dead) give back their buffers
+        for key in [key for key in self.entries if key not in self.used_ids]:
+            self.release_entry(self.entries.pop(key))
+
+    def release(self) -> None:
+        for entry in self.entries.values():
+            self.release_entry(entry)
+        self.entries = {}
+
+    def release_entry(self, entry: dict) -> None:
+        render_group = entry["render_group"]
+        render_group["vao"].release()
+        for vbo in render_group["vbos"].values():
+            vbo.release()
+        if render_group["ibo"] is not None:
+            render_group["ibo"].release()
+
+    # Change detection
+
+    def get_source_keys(self, mobject: Mobject) -> list[str]:
+        sources = getattr(mobject, "shader_data_sources", None)
+        if sources is None:
+            return [key for key in mobject.data if key != "bounding_box"]
+        return sorted(set(key for keys in sources.values() for key in keys))
+
+    @staticmethod
+    def get_instance_attributes(mobject: Mobject) -> list[str]:
+        dtype = getattr(mobject, "instance_dtype", None)
+        return [] if dtype is None else [name for name, *_ in dtype]
+
+    def get_dirty_attributes(self, mobject: Mobject, dirty_keys: set[str]) -> list[str]:
+        sources = getattr(mobject, "shader_data_sources", None)
+        attributes = [*mobject.shader_wrapper.vert_attributes, *self.get_instance_attributes(mobject)]
+        if sources is None:
+            return list(attributes) if dirty_keys else []
+        return [name for name in attributes if dirty_keys.intersection(sources.get(name, ()))]
+
+    @staticmethod
+    def update_versions(seen: dict, mobject: Mobject, keys: list[str]) -> tuple[set[str], bool]:
+        '''Compares the data versions of a mobject (see VersionedData) with those in `seen`, which are refreshed.
+        Returns the keys which changed, and whether the vertex indices did (a new array, or a bumped "__indices__").
+        Without versions, e.g. a plain data dict, every key is considered changed.'''
+        versions = getattr(mobject.data, "versions", {})
+        dirty_keys = set()
+        for key in keys:
+            version = versions.get(key)
+            if version is None or seen.get(key) != version:
+                seen[key] = version
+                dirty_keys.add(key)
+        # NOTE: the indices array is only held (not copied), it's compared by identity
+        indices = (mobject.get_shader_vert_indices(), versions.get("__indices__"))
+        old = seen.get("__indices__")
+        indices_changed = old is None or old[0] is not indices[0] or old[1] != indices[1]
+        seen["__indices__"] = indices
+        return dirty_keys, indices_changed
+
+    # Render groups
+
+    def get_render_group(self, mobject: Mobject, camera: "PBRCamera") -> dict:
+        shader_wrapper = mobject.shader_wrapper
+        shader_wrapper.uniforms = mobject.get_shader_uniforms()
+        shader_wrapper.depth_test = mobject.depth_test
+        program, _ = camera.get_shader_program(shader_wrapper)
+
+        key = id(mobject)
+        self.used_ids.add(key)
+        entry = self.entries.get(key)
+        if entry is not None and (entry["mobject_ref"]() is not mobject or entry["render_group"]["prog"] is not program):
+            self.release_entry(self.entries.pop(key)) # id reused by another mobject, or the shader code changed
+            entry = None
+
+        if entry is None:
+            entry = {"mobject_ref": weakref.ref(mobject), "versions": {}, "render_group": None}
+
+        dirty_keys, indices_changed = self.update_versions(entry["versions"], mobject, self.get_source_keys(mobject))
+        indices = mobject.get_shader_vert_indices()
+
+        if entry["render_group"] is not None and not dirty_keys and not indices_changed:
+            return entry["render_group"]
+
+        render_group = entry["render_group"]
+        instance_attributes = self.get_instance_attributes(mobject)
+        n_instances = mobject.get_num_instances() if instance_attributes else None
+        dirty_attributes = self.get_dirty_attributes(mobject, dirty_keys)
+        # per-vertex data is only gathered when it's needed, e.g. not when only the instances moved
+        shader_data = None
+        if render_group is None or any(name not in instance_attributes for name in dirty_attributes):
+            shader_data = mobject.get_shader_data()
+
+        if render_group is None or (shader_data is not None and render_group["num_vertices"] != len(shader_data)) \
+                or (render_group["ibo"] is None) != (indices is None) or render_group["instances"] != n_instances:
+            if render_group is not None:
+                self.release_entry(entry)
+            if shader_data is None:
+                shader_data = mobject.get_shader_data()
+            instance_data = mobject.get_instance_data() if instance_attributes else None
+            entry["render_group"] = self.create_render_group(shader_wrapper, program, shader_data, indices, instance_data)
+            self.entries[key] = entry
+            return entry["render_group"]
+
+        instance_data = None
+        if any(name in instance_attributes for name in dirty_attributes):
+            instance_data = mobject.get_instance_data()
+        for name in dirty_attributes:
+            self.write(render_group["vbos"][name], (instance_data if name in instance_attributes else shader_data)[name])
+        if indices_changed:
+            render_group["ibo"].orphan(indices.size * 4)
+            self.write(render_group["ibo"], indices.astype('i4'))
+        return render_group
+
+    def create_render_group(
+        self,
+        shader_wrapper,
+        program: moderngl.Program,
+        shader_data: np.ndarray,
+        indices: np.ndarray | None,
+        instance_data: np.ndarray | None = None
+    ) -> dict:
+        vbos = {}
+        content = []
+        attributes = [(name, shader_data, "") for name in shader_wrapper.vert_attributes]
+        if instance_data is not None:
+            attributes.extend((name, instance_data, " /i") for name in instance_data.dtype.names)
+        for name, data, divisor in attributes:
+            vbos[name] = self.buffer(data[name])
+            if program.get(name, None) is not None: # skip attributes optimized out by the compiler
+                content.append((vbos[name], moderngl.detect_format(program, (name,)) + divisor, name))
+        ibo = None if indices is None else self.buffer(indices.astype('i4'))
+        vao = track_gl(self.ctx.vertex_array(program=program, content=content, index_buffer=ibo), self)
+        return {
+            "vbo": None,        # see "vbos"
+            "vbos": vbos,
+            "ibo": ibo,
+            "vao": vao,
+            "prog": program,
+            "shader_wrapper": shader_wrapper,
+            "single_use": False,
+            "num_vertices": len(shader_data),
+            "instances": None if instance_data is None else len(instance_data), # see PBRCamera.render
+        }
+
+    def buffer(self, array: np.ndarray) -> moderngl.Buffer:
+        data = np.ascontiguousarray(array).tobytes()
+        self.upload_bytes += len(data)
+        return track_gl(self.ctx.buffer(data), self)
+
+    def write(self, buffer: moderngl.Buffer, array: np.ndarray) -> None:
+        data = np.ascontiguousarray(array).tobytes()
+        self.upload_bytes += len(data)
+        buffer.write(data)
@@ -0,0 +1,155 @@
+import numpy as np
+import moderngl
+from typing import Tuple
+
+from manimgl_3d.camera_frame import MyCameraFrame
+from manimgl_3d.utils.gl_resources import track_gl
+
+# NOTE: must match LIGHT_TEXTURE_WIDTH in pbr/frag.glsl
+LIGHT_TEXTURE_WIDTH = 1024
+
+# Texture units reserved for the light textures, away from the ones used by materials and manimlib
+LIGHT_TEXTURE_LOCATIONS = {
+    "light_data": 20,
+    "light_tiles": 21,
+    "light_indices": 22,
+}
+
+CUBE_CORNERS = np.array([
+    [x, y, z]
+    for x in (-1., 1.)
+    for y in (-1., 1.)
+    for z in (-1., 1.)
+])
+
+
+def get_light_tile_ranges(
+        frame: MyCameraFrame,
+        centers: np.ndarray,
+        radii: np.ndarray,
+        pixel_shape: Tuple[int, int],
+        tile_size: int
+    ) -> np.ndarray:
+    '''Returns the inclusive screen tile range (x0, y0, x1, y1) covered by each light's sphere of influence.
+    Lights which are off screen get an empty range (x1 < x0).'''
+
+    pw, ph = pixel_shape
+    n_tiles_x, n_tiles_y = -(-pw // tile_size), -(-ph // tile_size)
+    n = len(centers)
+    if n == 0:
+        return np.zeros((0, 4), dtype=int)
+
+    # project the bounding cube of each sphere, which conservatively contains the projected sphere
+    corners = centers[:, None, :] + radii[:, None, None] * CUBE_CORNERS
+    clip = frame.get_clip_coordinates(corners.reshape(-1, 3)).reshape(n, len(CUBE_CORNERS), 4)
+    w = clip[..., 3]
+    in_front = w > 1e-6
+    ndc = clip[..., :2] / np.where(in_front, w, 1.0)[..., None]
+
+    ndc_min = np.where(in_front[..., None], ndc, np.inf).min(axis=1)
+    ndc_max = np.where(in_front[..., None], ndc, -np.inf).max(axis=1)
+    crossing = ~in_front.all(axis=1) & in_front.any(axis=1)  # the sphere crosses the camera plane
+    ndc_min[crossing] = -1.0
+    ndc_max[crossing] = 1.0
+
+    pixel_size = np.array([pw, ph])
+    tile_min = np.floor((ndc_min + 1.0) / 2.0 * pixel_size / tile_size).astype(int)
+    tile_max = np.floor((ndc_max + 1.0) / 2.0 * pixel_size / tile_size).astype(int)
+    off_screen = (tile_max < 0).any(axis=1) | (tile_min >= [n_tiles_x, n_tiles_y]).any(axis=1) | ~in_front.any(axis=1)
+
+    tile_min = np.clip(tile_min, 0, [n_tiles_x - 1, n_tiles_y - 1])
+    tile_max = np.clip(tile_max, 0, [n_tiles_x - 1, n_tiles_y - 1])
+    ranges = np.hstack([tile_min, tile_max])
+    ranges[off_screen] = (0, 0, -1, -1)
+    return ranges
+
+
+class LightGrid:
+    '''Light storage shared by all PBR programs, with tiled light culling.
+
+    All the lights are packed into one float texture (2 texels per light: position & radius, color & windowed),
+    uploaded once per frame. The screen is split into tiles of `tile_size` pixels, and each tile lists
+    the lights whose sphere of influence overlaps it, so each fragment only evaluates those lights.'''
+
+    def __init__(self, ctx: moderngl.Context, tile_size: int = 64):
+        self.ctx = ctx
+        self.tile_size = tile_size
+        self.textures: dict[str, moderngl.Texture] = {}
+        self.light_count = 0
+        self.culled_light_count = 0  # lights affecting no tile in the last frame
+        self.mean_tile_light_count = 0.0 # lights evaluated per tile in the last frame, on average
+
+    def get_texture(self, name: str, size: Tuple[int, int], components: int, dtype: str) -> moderngl.Texture:
+        texture = self.textures.get(name)
+        if texture is None or texture.size != size:
+            if texture is not None:
+                texture.release()
+            texture = track_gl(self.ctx.texture(size=size, components=components, dtype=dtype), self)
+            texture.filter = (moderngl.NEAREST, moderngl.NEAREST) # integer textures are incomplete with linear filtering
+            texture.repeat_x, texture.repeat_y = False, False
+            self.textures[name] = texture
+        return texture
+
+    @staticmethod
+    def get_texture_size(n_texels: int) -> Tuple[int, int]:
+        # Grow by powers of two, avoiding reallocation on every frame
+        rows = 1 << max(0, int(np.ceil(np.log2(max(1, -(-n_texels // LIGHT_TEXTURE_WIDTH))))))
+        return (LIGHT_TEXTURE_WIDTH, rows)
+
+    def write_texels(self, name: str, data: np.ndarray, dtype: str) -> None:
+        n_texels, components = data.shape
+        texture = self.get_texture(name, self.get_texture_size(n_texels), components, dtype)
+        padded = np.zeros((texture.size[0] * texture.size[1], components), dtype=data.dtype)
+        padded[:n_texels] = data
+        texture.write(padded.tobytes())
+
+    def update(self, frame: MyCameraFrame, lights: list, pixel_shape: Tuple[int, int], cutoff: float) -> None:
+        pw, ph = pixel_shape
+        n_tiles_x, n_tiles_y = -(-pw // self.tile_size), -(-ph // self.tile_size)
+        n = len(lights)
+
+        centers = np.array([light.get_location() for light in lights], dtype=float).reshape(n, 3)
+        colors = np.array([light.get_light_color() for light in lights], dtype=float).reshape(n, 3)
+        radii = np.array([light.get_light_radius(cutoff) for light in lights], dtype=float)
+
+        # light data
+        light_data = np.zeros((2 * n, 4), dtype='f4')
+        light_data[0::2, :3] = centers
+        light_data[0::2, 3] = radii
+        light_data[1::2, :3] = colors
+        light_data[1::2, 3] = [light.light_radius is not None for light in lights] # fades out up to its own radius
+        self.write_texels("light_data", light_data, 'f4')
+
+        # tile -> lights
+        x0, y0, x1, y1 = get_light_tile_ranges(frame, centers, radii, (pw, ph), self.tile_size).T[:, :, None, None]
+        tile_x = np.arange(n_tiles_x)[None, None, :]
+        tile_y = np.arange(n_tiles_y)[None, :, None]
+        overlap = (tile_x >= x0) & (tile_x <= x1) & (tile_y >= y0) & (tile_y <= y1) # shape = (n, ny, nx)
+        overlap = overlap.reshape(n, n_tiles_y * n_tiles_x).T                   # shape = (ny * nx, n)
+
+        counts = overlap.sum(axis=1)
+        offsets = np.cumsum(counts) - counts
+        _, light_indices = np.nonzero(overlap)  # sorted tile by tile
+
+        tiles = np.stack([offsets, counts], axis=-1).astype('i4').reshape(n_tiles_y, n_tiles_x, 2)
+        self.get_texture("light_tiles", (n_tiles_x, n_tiles_y), 2, 'i4').write(tiles.tobytes())
+        self.write_texels("light_indices", light_indices.astype('i4').reshape(-1, 1), 'i4')
+
+        self.light_count = n
+        self.culled_light_count = n - (overlap.any(axis=0).sum() if n else 0)
+        self.mean_tile_light_count = float(counts.mean())
+
+    def use(self) -> None:
+        for name, location in LIGHT_TEXTURE_LOCATIONS.items():
+            self.textures[name].use(location=location)
+
+    def get_uniforms(self) -> dict:
+        return {
+            **LIGHT_TEXTURE_LOCATIONS,
+            "light_tile_size": self.tile_size,
+        }
+
+    def release(self) -> None:
+        for texture in self.textures.values():
+            texture.release()
+        self.textures = {}
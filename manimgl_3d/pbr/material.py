@@ -1,12 +1,16 @@
 import numpy as np
-from typing import Union, Optional, Tuple, List
+from typing import Union, Optional, Tuple, List, Hashable
 from functools import cache
 import moderngl as mgl
 from OpenGL.GL import *
 import os
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor, Future
 
-from manimgl_3d.utils.gl_utils import image_path_to_texture, get_solid_texture
+from manimgl_3d.utils.gl_utils import get_solid_texture_array, solid_value_to_rgba, quantize_solid_value, write_texture_array_level
+from manimgl_3d.utils.image_utils import load_image_mips, expand_to_rgba
 from manimgl_3d.utils.directories_utils import get_manimgl_3d_dir
+from manimgl_3d.pbr.texture_manager import TextureManager
 
 PropertyValue = Union[float, Tuple[float], List[float], np.ndarray]
 TexturePath = str
@@ -15,6 +19,7 @@ class PBRMaterial:
     supported_types = (float, tuple, list, np.ndarray, str)
     property_names = ("albedo", "roughness", "metallic", "ao", "height", "normal")  # also the order of tid
     optional_properties = ("metallic", "ao", "height", "normal")
+    vector_properties = ("albedo", "normal")    # vec3 uniforms in the specialized shaders, the others are floats
 
     def __init__(
             self,
@@ -25,13 +30,18 @@ class PBRMaterial:
             height:     Union[PropertyValue, TexturePath] = 0.,
             normal:     Union[PropertyValue, TexturePath] = (0.5, 0.5, 1.),  # * 2 - 1
             *,
-            height_scale = 1.0
+            height_scale = 1.0,
+            mipmaps = True,
+            anisotropy = 8.0,
+            prefetch = True
     ):
         for data in (albedo, roughness, metallic, ao, height, normal):
             if not isinstance(data, self.supported_types):
                 raise TypeError('Unsupported type for material property:', type(data))
         
         self.height_scale = height_scale
+        self.mipmaps = mipmaps
+        self.anisotropy = anisotropy  # clamped to the maximum supported by the driver
         self._property_data = {
             "albedo": albedo,
             "roughness": roughness,
@@ -40,28 +50,179 @@ class PBRMaterial:
             "height": height,
             "normal": normal,
         }
+        self._decoding: dict[str, Future] = {}  # property name -> mip levels being decoded
+        # derived from the properties, which don't change (NOTE: not functools.cache, which would keep the material alive)
+        self._shader_defines: Optional[Tuple[str, ...]] = None
+        self._uniform_values: Optional[dict] = None
+        self._texture_layouts: dict[bool, tuple] = {} # specialized -> texture layout
+        if prefetch:
+            self.prefetch()
+
+    def prefetch(self, specialized: bool = True) -> None:
+        '''Starts decoding the image maps the shaders sample (see get_sampled_properties) in background threads,
+        leaving only the GL upload to the render thread.'''
+        for name in self.get_sampled_properties(specialized):
+            data = self._property_data[name]
+            if isinstance(data, str) and name not in self._decoding:
+                self._decoding[name] = get_decode_executor().submit(load_image_mips, data)
+
+    def wait_decoded(self) -> None:
+        for future in list(self._decoding.values()):
+            future.result()
     
-    @cache
-    def get_property_texture(self, context: mgl.Context, property_name: str) -> mgl.Texture:
+    def get_property_source_key(self, property_name: str) -> Hashable:
+        '''Identifies the content of a property map, so that identical maps are shared between materials.'''
+        data = self._property_data[property_name]
+        if isinstance(data, str):
+            return os.path.abspath(data)
+        return quantize_solid_value(data)
+
+    def get_max_displacement(self) -> float:
+        '''Upper bound of the distance the vertex shader moves the points along their normals (height map).'''
+        height = self._property_data["height"]
+        if isinstance(height, str):
+            return abs(self.height_scale) # texels are within [0, 1]
+        return float(np.max(np.abs(np.array(height, dtype=float)))) * abs(self.height_scale)
+
+    def is_constant(self, property_name: str) -> bool:
+        return not isinstance(self._property_data[property_name], str)
+
+    def get_shader_defines(self) -> Tuple[str, ...]:
+        '''Preprocessor flags of the shader variant specialized for this material, also its feature key: constant
+        properties are read from uniforms, normal mapping and displacement are skipped when they'd change nothing.'''
+        if self._shader_defines is not None:
+            return self._shader_defines
+        defines = [f"CONSTANT_{name.upper()}" for name in self.property_names if self.is_constant(name)]
+        if self.is_constant("normal") and np.array_equal(solid_value_to_rgba(self._property_data["normal"])[:3], (0.5, 0.5, 1.0)):
+            defines.append("FLAT_NORMAL")
+        if self.get_max_displacement() == 0:
+            defines.append("NO_DISPLACEMENT")
+        self._shader_defines = tuple(defines)
+        return self._shader_defines
+
+    def get_sampled_properties(self, specialized: bool = False) -> Tuple[str, ...]:
+        '''The properties the shaders read from textures, all of them unless the shaders are specialized (see get_shader_defines).'''
+        if not specialized:
+            return self.property_names
+        no_displacement = "NO_DISPLACEMENT" in self.get_shader_defines()
+        return tuple(
+            name for name in self.property_names
+            if not self.is_constant(name) and not (name == "height" and no_displacement)
+        )
+
+    def get_uniform_values(self) -> dict:
+        '''Uniforms of the constant properties in the specialized shaders, as sampling their 1x1 maps would give.'''
+        if self._uniform_values is not None:
+            return self._uniform_values
+        result = {}
+        for name in self.property_names:
+            if self.is_constant(name):
+                rgba = solid_value_to_rgba(self._property_data[name])
+                result["value_" + name] = tuple(rgba[:3].tolist()) if name in self.vector_properties else float(rgba[0])
+        self._uniform_values = result
+        return result
+
+    def get_property_texel_data(self, property_name: str) -> Tuple[Tuple[int, int], str, List[np.ndarray]]:
+        '''Returns the size, dtype and mip levels (a single one for constants) of a property map. Image levels keep
+        the channels of the file (see image_utils.build_mip_chain), constants are RGBA.'''
         data = self._property_data[property_name]
         if isinstance(data, str):
-            return image_path_to_texture(context, data)
+            future = self._decoding.pop(property_name, None) # the decoded levels are dropped once uploaded
+            levels = load_image_mips(data) if future is None else future.result()
+            return levels[0].shape[1::-1], 'f1', levels
         else:
-            return get_solid_texture(context, data)
-    
-    @cache
-    def get_pbr_textures(self, context: mgl.Context) -> list:
-        return [(tid, name, self.get_property_texture(context, name)) for tid, name in enumerate(self.property_names)]
+            return (1, 1), 'f4', [solid_value_to_rgba(quantize_solid_value(data)).reshape(1, 1, 4)] # the value its key stands for
+
+    def get_property_format(self, property_name: str) -> Tuple[Tuple[int, int], str]:
+        '''Returns the size and dtype of a property map, without decoding it.'''
+        data = self._property_data[property_name]
+        if isinstance(data, str):
+            with Image.open(data) as im: # only reads the header
+                return im.size, 'f1'
+        else:
+            return (1, 1), 'f4'
+
+    def get_texture_layout(self, specialized: bool = False) -> Tuple[List[Tuple[Hashable, Tuple[int, int], str, List[str]]], dict]:
+        '''Groups the property maps sharing the same size and dtype, each group is packed into one texture array.
+        Returns the groups (key, size, dtype, property names), and for each property, the index of its group and its layer.
+        Only the maps the shaders sample are included (see get_sampled_properties).'''
+        if specialized in self._texture_layouts:
+            return self._texture_layouts[specialized]
+        groups: dict[tuple, list] = {}
+        for name in self.get_sampled_properties(specialized):
+            groups.setdefault(self.get_property_format(name), []).append(name)
+
+        layout, layers = [], {}
+        for (size, dtype), names in groups.items():
+            for layer, name in enumerate(names):
+                layers[name] = (len(layout), layer)
+            source_keys = tuple(self.get_property_source_key(name) for name in names)
+            if all(self.is_constant(name) for name in names):
+                key = ("solid", source_keys) # pooled apart (see get_texture_arrays)
+            else:
+                key = ("array", size, dtype, source_keys, self.mipmaps, self.anisotropy)
+            layout.append((key, size, dtype, names))
+        self._texture_layouts[specialized] = (layout, layers)
+        return layout, layers
+
+    def get_texture_arrays(self, texture_manager: TextureManager, specialized: bool = False) -> Tuple[List[mgl.TextureArray], dict]:
+        '''Packs the property maps sharing the same size and dtype into the layers of one texture array,
+        so that binding the material costs one bind per array instead of one per property.
+        Returns the arrays, and for each property, the index of its array and its layer.'''
+        layout, layers = self.get_texture_layout(specialized)
+        arrays = [
+            # the 1x1 arrays of constants are shared by value by all the materials, and never evicted
+            get_solid_texture_array(texture_manager.ctx, key[1]) if key[0] == "solid" else
+            texture_manager.get(
+                key,
+                lambda context, size=size, dtype=dtype, names=names: self.load_texture_array(context, size, dtype, names),
+                owner=self
+            )
+            for key, size, dtype, names in layout
+        ]
+        return arrays, layers
+
+    def load_texture_array(self, context: mgl.Context, size: Tuple[int, int], dtype: str, names: List[str]) -> Tuple[mgl.TextureArray, int]:
+        levels = [
+            np.stack([expand_to_rgba(level) for level in level_layers])
+            for level_layers in zip(*(self.get_property_texel_data(name)[-1] for name in names))
+        ]
+        texture_array = context.texture_array(
+            size = (*size, len(names)),
+            components = 4,
+            data = levels[0].tobytes(),
+            dtype = dtype
+        )
+        if self.mipmaps and len(levels) > 1:
+            texture_array.build_mipmaps() # allocates the levels, then overwritten with the (cached) box filtered ones
+            for i, level in enumerate(levels[1:], start=1):
+                write_texture_array_level(context, texture_array, i, level)
+            texture_array.anisotropy = self.anisotropy
+        else:
+            levels = levels[:1]
+        return texture_array, sum(level.nbytes for level in levels)
 
     def get_property_data(self): 
         return self._property_data # should not change it
-    
-    # TODO: release textures?
+
+    def release_textures(self, texture_manager: TextureManager) -> None:
+        '''Drops the references of this material, its textures may then be evicted.'''
+        texture_manager.release_owner(self)
+        self._decoding = {}
+
+@cache
+def get_decode_executor() -> ThreadPoolExecutor:
+    # image decoding and resizing in PIL release the GIL
+    return ThreadPoolExecutor(
+        max_workers=min(len(PBRMaterial.property_names), os.cpu_count() or 1),
+        thread_name_prefix="manimgl_3d_decode"
+    )
 
 def find_contain(str_list, flags):
     return [string for string in str_list if any([flag in string for flag in flags])]
 
-def load_material(directory: str, *, height_scale = 1.0) -> PBRMaterial:
+def load_material(directory: str, *, height_scale = 1.0, mipmaps = True, anisotropy = 8.0, prefetch = True) -> PBRMaterial:
+    '''Finds the maps of a material in a directory, and (with `prefetch`) starts decoding them right away.'''
     file_list = os.listdir(directory)
 
     kwargs = {}
@@ -75,4 +236,4 @@ def load_material(directory: str, *, height_scale = 1.0) -> PBRMaterial:
             if name not in PBRMaterial.optional_properties:
                 raise FileNotFoundError(f'{name} texture file not found.')
     
-    return PBRMaterial(**kwargs, height_scale=height_scale)
\ No newline at end of file
+    return PBRMaterial(**kwargs, height_scale=height_scale, mipmaps=mipmaps, anisotropy=anisotropy, prefetch=prefetch)
\ No newline at end of file
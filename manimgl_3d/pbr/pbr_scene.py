@@ -1,12 +1,30 @@
 from manimlib import *
+from manimlib.scene.scene import EndSceneEarlyException
 from manimgl_3d.camera_frame import MyCameraFrame
+from manimgl_3d.frame_writer import StreamingSceneFileWriter
+from manimgl_3d.gpu_timer import GPUTimer
 from manimgl_3d.pbr.surface_pbr import PointLight
 from manimgl_3d.pbr.material import PBRMaterial
+from manimgl_3d.pbr.buffer_cache import PBRBufferCache
+from manimgl_3d.pbr.static_batching import StaticBatcher
+from manimgl_3d.pbr.lighting import LightGrid
+from manimgl_3d.pbr.texture_manager import TextureManager
+from manimgl_3d.pbr.readback import PixelBufferRing
 from manimgl_3d.shader_compatibility import *
-from manimgl_3d.utils.gl_utils import render_quad, blit_fbo, gl_blit_fbo, render_texture_on_quad, get_quad_prog
+from manimgl_3d.utils.gl_utils import render_quad, blit_fbo, gl_blit_fbo, render_texture_on_quad, get_quad_prog, release_quad_vaos, release_solid_textures
+from manimgl_3d.utils.gl_resources import track_gl, gl_resources
+from manimgl_3d.utils.shader_cache import ShaderProgramCache
+from manimgl_3d.utils.directories_utils import enable_driver_shader_cache
 
 from OpenGL.GL import * # FIX
 from typing import List
+from contextlib import nullcontext
+
+# bloom chain settings of PBRCamera.bloom_quality
+BLOOM_QUALITY_TIERS = {
+    "preview": {"bloom_start_mip": 1, "mip_depth": 4},  # starts at quarter resolution
+    "final": {"bloom_start_mip": 0, "mip_depth": 6},
+}
 
 # TODO: support multiple light sources and light types (other than point light source)
 class PBRCamera(Camera):
@@ -17,22 +35,63 @@ class PBRCamera(Camera):
 
         'samples': 4,      # for multisampling anti-alias
         'exposure': 1.0,   # for HDR tone mapping
+
+        # lights (see LightGrid)
+        'light_cutoff': None,   # radiance below which a point light without light_radius is ignored, see get_light_cutoff
+        'light_tile_size': 64,  # in pixels, the screen is split into tiles for light culling
+
+        'frustum_culling': True, # skip the PBR mobjects (and groups) whose bounding box is out of view
+        'static_batching': False, # merge the static PBR mobjects sharing a material into one draw call (see StaticBatcher)
+        'shader_permutations': True, # shaders specialized per material, constant properties being uniforms (see PBRMaterial.get_shader_defines)
+        'texture_budget': 2 * 1024**3, # in bytes, material textures beyond it are evicted (least recently used first), None for no limit
+
+        # render targets
+        'render_scale': 1.0,            # the HDR targets are this fraction of the output size, upscaled by the final tone mapping pass
+        'render_target_budget': None,   # in bytes, checked against estimate_render_target_memory before allocating, None for no limit
+        'over_budget': 'raise',         # 'raise' a MemoryError, or 'degrade' (fewer samples, then a lower render_scale) until it fits
+
+        'standalone_backend': None, # backend of the standalone context when there's no window, e.g. 'egl' on headless Linux
+        'readback_buffers': 3,      # pixel pack buffers in flight when writing movies (see PixelBufferRing), 0 reads each frame synchronously
+        'check_gl_leaks': True,     # log the GL objects of the context still alive once the scene is torn down (see GLResourceRegistry)
+        'driver_shader_cache': False, # point the disk cache of the driver to the manimgl_3d cache directory (see enable_driver_shader_cache)
+        'shader_warm_up': True,     # compile the programs of the scene (and its material permutations) in PBRScene.prefetch_materials, see warm_up_programs
+        'gpu_timing': False,        # time each pass of capture with GL timer queries (see GPUTimer)
+        'gpu_timing_overlay': False, # draw the average pass timings as a bar at the bottom of the frame, full width = one frame at frame_rate
         
         # bloom effect related
         'bloom': True,
-        'bloom_threshold': 1.0,
-        'mip_depth': 6,    # You can play around with this value, should not be larger than log2(pixel_width)
+        'bloom_quality': None, # 'preview' or 'final' (see BLOOM_QUALITY_TIERS), None to use bloom_start_mip and mip_depth
+        'bloom_start_mip': 0,  # the bloom chain starts at 1/2^(bloom_start_mip+1) of the resolution
+        'mip_depth': 6,    # You can play around with this value, clamped so that the smallest mip is at least 1 pixel
         'bloom_filter_radius': 0.005,
         'bloom_strength': 0.04,
     }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        if self.bloom_quality is not None:
+            for key, value in BLOOM_QUALITY_TIERS[self.bloom_quality].items():
+                setattr(self, key, value)
+        self.check_render_target_budget()
+        self.program_cache = ShaderProgramCache(self.ctx) # all the programs of this camera, one per distinct source
         self.init_pbr()
+        self.buffer_cache = PBRBufferCache(self.ctx) # vbo/ibo/vao of PBR mobjects, kept alive across frames
+        self.static_batcher = StaticBatcher(self.buffer_cache)
+        self.light_grid = LightGrid(self.ctx, self.light_tile_size)
+        self.texture_manager = TextureManager(self.ctx, self.texture_budget)
+        self.frame_readback = PixelBufferRing(self.ctx, self.readback_buffers)
+        self.gpu_timer = GPUTimer(self.ctx) if self.gpu_timing else None
+        self.reset_draw_stats()
 
     def init_context(self, ctx: moderngl.Context | None = None) -> None:
+        if self.driver_shader_cache:
+            enable_driver_shader_cache()
+        self.is_standalone = ctx is None # the output framebuffer is ours, not the window's
         if ctx is None:
-            ctx = moderngl.create_standalone_context()
+            if self.standalone_backend is None:
+                ctx = moderngl.create_standalone_context()
+            else:
+                ctx = moderngl.create_standalone_context(backend=self.standalone_backend)
             fbo = self.get_fbo(ctx, 0)
         else:
             fbo = ctx.detect_framebuffer()
@@ -40,48 +99,96 @@ class PBRCamera(Camera):
         self.fbo = fbo
         self.set_ctx_blending(True) # for compatiblity
 
+    def get_render_size(self, render_scale: float | None = None) -> tuple[int, int]:
+        '''Size of the HDR render targets, the output size scaled by render_scale.'''
+        if render_scale is None:
+            render_scale = self.render_scale
+        return (max(1, round(self.pixel_width * render_scale)), max(1, round(self.pixel_height * render_scale)))
+
+    def get_bloom_mip_sizes(self, pw: int, ph: int) -> List[tuple]:
+        '''(float size, int size) of each mip of the bloom chain, large to small, none without bloom.'''
+        if not self.bloom: # nothing reads the chain, so its targets are never allocated
+            return []
+        max_depth = int(np.log2(min(pw, ph))) - self.bloom_start_mip
+        return [
+            ((pw/2**(i+1), ph/2**(i+1)), (int(pw/2**(i+1)), int(ph/2**(i+1))))
+            for i in range(self.bloom_start_mip, self.bloom_start_mip + max(1, min(self.mip_depth, max_depth)))
+        ]
+
+    def estimate_render_target_memory(self, render_scale: float | None = None, samples: int | None = None) -> dict[str, int]:
+        '''Bytes taken by each render target init_pbr allocates (and the output framebuffer when there's no window).'''
+        if samples is None:
+            samples = self.samples
+        pw, ph = self.get_render_size(render_scale)
+        n_samples = max(1, samples)
+        result = {
+            "hdr_color_msaa": pw * ph * 8 * n_samples,   # RGBA16F
+            "hdr_depth_msaa": pw * ph * 4 * n_samples,   # 24 bit depth, padded
+            "hdr_color": pw * ph * 8,
+            "hdr_depth": pw * ph * 4,
+            "bloom_mips": sum(w * h * 4 for _, (w, h) in self.get_bloom_mip_sizes(pw, ph)), # R11F_G11F_B10F
+        }
+        if self.is_standalone:
+            result["output"] = self.pixel_width * self.pixel_height * (4 + 4) # RGBA8 color + depth
+        return result
+
+    def check_render_target_budget(self) -> None:
+        if self.render_target_budget is None:
+            return
+        def total():
+            return sum(self.estimate_render_target_memory().values())
+
+        if total() > self.render_target_budget and self.over_budget == 'degrade':
+            requested = (self.samples, self.render_scale)
+            while total() > self.render_target_budget and self.samples > 0:
+                self.samples = self.samples // 2 if self.samples > 1 else 0
+            while total() > self.render_target_budget and self.render_scale > 0.25:
+                self.render_scale = max(0.25, self.render_scale * 0.75)
+            if (self.samples, self.render_scale) != requested:
+                log.warning(
+                    f"Render targets exceed the budget of {self.render_target_budget / 2**20:.0f} MB, "
+                    f"degraded from samples={requested[0]}, render_scale={requested[1]} "
+                    f"to samples={self.samples}, render_scale={self.render_scale:.3f}"
+                )
+        if total() > self.render_target_budget:
+            estimate = ", ".join(f"{name} {size / 2**20:.1f} MB" for name, size in self.estimate_render_target_memory().items())
+            raise MemoryError(
+                f"Render targets need {total() / 2**20:.1f} MB ({estimate}), "
+                f"over the budget of {self.render_target_budget / 2**20:.1f} MB. "
+                "Lower the resolution, samples or render_scale, or set over_budget='degrade'."
+            )
+
     def init_pbr(self) -> None:
-        pw, ph = self.pixel_width, self.pixel_height
+        pw, ph = self.get_render_size()
 
         if self.n_channels != 4:
             raise NotImplementedError('PBRCamera currently only supports 4 components for color buffer (RGBA).')
 
-        # HDR MSAA FBO -> hdr_color_buffer_msaa, hdr_bright_buffer_msaa
+        # HDR MSAA FBO -> hdr_color_buffer_msaa
         # NOTE: for compatibility with normal Mobjects, use RGBA instead of RGB
-        self.hdr_color_buffer_msaa = self.ctx.texture(
+        # NOTE: a single color attachment, the bloom is extracted from the resolved color by the mip chain below
+        self.hdr_color_buffer_msaa = track_gl(self.ctx.texture(
                 size=(pw, ph),
                 components=self.n_channels,
                 samples=self.samples,
                 internal_format = GL_RGBA16F # use floating point framebuffers for HDR
-            )
-        self.hdr_bright_buffer_msaa = self.ctx.texture(
-            size=(pw, ph),
-            components=self.n_channels,
-            samples=self.samples,
-            internal_format = GL_RGBA16F
-        )
-        self.fbo_hdr_msaa = self.ctx.framebuffer(
-            color_attachments = (self.hdr_color_buffer_msaa, self.hdr_bright_buffer_msaa),
-            depth_attachment = self.ctx.depth_renderbuffer((pw, ph), samples=self.samples)
-        )
-
-        # HDR FBO -> hdr_color_buffer, hdr_bright_buffer (for resolution)
-        self.hdr_color_buffer = self.ctx.texture(
+            ), self)
+        self.fbo_hdr_msaa = track_gl(self.ctx.framebuffer(
+            color_attachments = (self.hdr_color_buffer_msaa,),
+            depth_attachment = track_gl(self.ctx.depth_renderbuffer((pw, ph), samples=self.samples), self)
+        ), self)
+
+        # HDR FBO -> hdr_color_buffer (for resolution)
+        self.hdr_color_buffer = track_gl(self.ctx.texture(
                 size=(pw, ph),
                 components=self.n_channels,
                 internal_format = GL_RGBA16F
-            )
+            ), self)
         self.hdr_color_buffer.repeat_x, self.hdr_color_buffer.repeat_y = False, False
-        self.hdr_bright_buffer = self.ctx.texture(  # TODO: Abandoned
-            size=(pw, ph),
-            components=self.n_channels,
-            internal_format = GL_RGBA16F
-        )
-        self.hdr_bright_buffer.repeat_x, self.hdr_bright_buffer.repeat_y = False, False
-        self.fbo_hdr = self.ctx.framebuffer(
-            color_attachments = (self.hdr_color_buffer, self.hdr_bright_buffer),
-            depth_attachment = self.ctx.depth_renderbuffer((pw, ph))
-        )
+        self.fbo_hdr = track_gl(self.ctx.framebuffer(
+            color_attachments = (self.hdr_color_buffer,),
+            depth_attachment = track_gl(self.ctx.depth_renderbuffer((pw, ph)), self)
+        ), self)
 
         # # FBO for bloom effect (legacy)
         # self.fbos_pingpong: List[moderngl.Framebuffer] = []
@@ -95,29 +202,8 @@ class PBRCamera(Camera):
         #     fbo_pingpang = self.ctx.framebuffer(color_attachments=(pingpang_color_buffer,), depth_attachment=None)
         #     self.fbos_pingpong.append(fbo_pingpang)
 
-        # textures and fbo for bloom mipmaps
-        self.mip_chain = [] # large to small
-        for i in range(self.mip_depth):
-            mip_size_float = (pw/2**(i+1), ph/2**(i+1))
-            mip_size_int = (int(pw/2**(i+1)), int(ph/2**(i+1)))
-            
-            mip_map = self.ctx.texture(
-                size = mip_size_int,
-                components = 3, ##
-                internal_format = GL_R11F_G11F_B10F
-            )
-            mip_map.repeat_x, mip_map.repeat_y = False, False
-            self.mip_chain.append((mip_size_float, mip_size_int, mip_map))
-        
-        self.fbo_bloom = self.ctx.framebuffer(
-            color_attachments = (self.mip_chain[0][-1],) # color attachment of fbo_bloom will change dynamically during rendering
-        )
-        
-        # pbr shader program
-        self.gaussian_blur_program = self.ctx.program(
-            vertex_shader = get_shader_code_from_file_extended('pbr/quad_vert.glsl'),
-            fragment_shader = get_shader_code_from_file_extended('pbr/gaussian_blur_frag.glsl')
-        )
+        # textures and fbo for bloom mipmaps, only allocated with bloom (see init_bloom_targets)
+        self.init_bloom_targets(pw, ph)
         
         # # bloom shader program (legacy)
         # self.bloom_final_program = self.ctx.program(
@@ -129,14 +215,14 @@ class PBRCamera(Camera):
         # self.bloom_final_program['exposure'] = self.exposure
 
         # bloom downsample shader program
-        self.downsample_program = self.ctx.program(
+        self.downsample_program = self.program_cache.get(
             vertex_shader = get_shader_code_from_file_extended('pbr/quad_vert.glsl'),
             fragment_shader = get_shader_code_from_file_extended('pbr/downsample_frag.glsl')
         )
         self.downsample_program["srcTexture"] = 0 # texture
 
         # bloom upsample shader program
-        self.upsample_program = self.ctx.program(
+        self.upsample_program = self.program_cache.get(
             vertex_shader = get_shader_code_from_file_extended('pbr/quad_vert.glsl'),
             fragment_shader = get_shader_code_from_file_extended('pbr/upsample_frag.glsl')
         )
@@ -144,7 +230,7 @@ class PBRCamera(Camera):
         self.upsample_program["filterRadius"] = self.bloom_filter_radius
 
         # bloom final shader program
-        self.bloom_final_program = self.ctx.program(
+        self.bloom_final_program = self.program_cache.get(
             vertex_shader = get_shader_code_from_file_extended('pbr/quad_vert.glsl'),
             fragment_shader = get_shader_code_from_file_extended('pbr/bloom_final_frag.glsl')
         )
@@ -154,13 +240,45 @@ class PBRCamera(Camera):
         self.bloom_final_program["bloomStrength"] = self.bloom_strength
 
         # no bloom shader program (tone mapping + gamma correction)
-        self.hdr_final_program = self.ctx.program(
+        self.hdr_final_program = self.program_cache.get(
             vertex_shader = get_shader_code_from_file_extended('pbr/quad_vert.glsl'),
             fragment_shader = get_shader_code_from_file_extended('pbr/no_bloom_final_frag.glsl')
         )
         self.hdr_final_program["hdr_rendered"] = 0
         self.hdr_final_program['exposure'] = self.exposure
 
+    def get_material_defines(self, shader_wrapper: ShaderWrapper) -> tuple[str, ...]:
+        if not self.shader_permutations or not isinstance(shader_wrapper, PBRShaderWrapper):
+            return ()
+        return shader_wrapper.material.get_shader_defines()
+
+    def get_shader_program(self, shader_wrapper: ShaderWrapper) -> tuple[moderngl.Program, str]:
+        defines = self.get_material_defines(shader_wrapper)
+        sid = (shader_wrapper.get_program_id(), defines) if defines else shader_wrapper.get_program_id()
+        if sid not in self.id_to_shader_program:
+            if defines:
+                code = shader_wrapper.get_variant_program_code(defines)
+            else:
+                code = shader_wrapper.get_program_code()
+            program = self.program_cache.get(**code)
+            attributes = [name for name in shader_wrapper.vert_attributes if program.get(name, None) is not None] # e.g. no tangent with FLAT_NORMAL
+            self.id_to_shader_program[sid] = (program, moderngl.detect_format(program, attributes))
+        return self.id_to_shader_program[sid]
+
+    def warm_up_programs(self, mobjects: List[Mobject]) -> int:
+        '''Compiles the programs (one per material permutation) of the PBR mobjects among the families of `mobjects`,
+        and those of the other mobjects of the list, rather than in the first frame they're drawn in. Returns how many.'''
+        compiled = self.program_cache.stats["compiled"]
+        for mobject in mobjects:
+            if not self.has_pbr_family_member(mobject):
+                for shader_wrapper in mobject.get_shader_wrapper_list():
+                    self.get_shader_program(shader_wrapper)
+                continue
+            for submobject in mobject.get_family():
+                if isinstance(submobject, PBRMobjectShaderCompatibilityMixin) and submobject.has_points():
+                    self.get_shader_program(submobject.shader_wrapper)
+        return self.program_cache.stats["compiled"] - compiled
+
     def init_light_source(self):
         # NOTE: This light source only affacts non-PBR mobjects. If you want it 
         # to also affacts PBR mobjects, add it to the scene explicitly:
@@ -172,7 +290,7 @@ class PBRCamera(Camera):
 
     def refresh_perspective_uniforms(self):
         frame = self.frame
-        pw, ph = self.get_pixel_shape()
+        pw, ph = self.get_render_size() # non-PBR mobjects are drawn into the HDR targets too
         fw, fh = frame.get_shape()
 
         # TODO, this should probably be a mobject uniform, with
@@ -194,9 +312,8 @@ class PBRCamera(Camera):
             "light_source_position":    tuple(self.light_source.get_location()),
             
             # specifically for PBR objects
-            "relative_focal_distance":  frame.get_focal_distance() / frame.get_scale(), # FIXME: not sure why unscale it, but it just works!
+            "relative_focal_distance":  frame.get_relative_focal_distance(),
             "view":                     tuple(view_matrix.T.flatten()), # including frame scaling information
-            "bloom_threshold":          self.bloom_threshold
         }
 
     def clear(self): # called in Scene.update_frame(), improper?
@@ -212,38 +329,261 @@ class PBRCamera(Camera):
             components=self.n_channels,
             dtype=dtype
         )
+
+    def read_frame_async(self, dtype: str = 'f1') -> List[bytes]:
+        '''Queues the readback of the current frame, returns the earlier frames fetched meanwhile (oldest first).'''
+        if self.readback_buffers <= 0:
+            return [self.get_raw_fbo_data(dtype)]
+        return self.frame_readback.push(self.fbo, self.fbo.viewport, self.n_channels, dtype)
+
+    def flush_frame_readbacks(self) -> List[bytes]:
+        return self.frame_readback.flush()
     
     def use_pbr_textures(self, program: moderngl.Program, material: PBRMaterial):
-        program['height_scale'] = material.height_scale
-        for tid, name, texture  in material.get_pbr_textures(self.ctx):
-            texture.use(location = tid)
-            program['tex_' + name].value = tid
-
-    def use_light_sources(self, program: moderngl.Program, lights: List[PointLight]):
-        MAX_LIGHTS = 16
-
-        light_count = len(lights)
-        if light_count > MAX_LIGHTS:
-            raise ValueError(f'Too many lights! Got {light_count}, but MAX_LIGHTS is {MAX_LIGHTS}.')
-
-        light_positions = np.zeros((MAX_LIGHTS, 3), dtype='f4')
-        light_colors = np.zeros((MAX_LIGHTS, 3), dtype='f4')
-        for i, light in enumerate(lights):
-            light_positions[i] = light.get_location()
-            light_colors[i] = light.get_light_color()
-        
-        program['light_positions'].write(light_positions.flatten().tobytes())
-        program['light_colors'].write(light_colors.flatten().tobytes())
-        program['light_count'].value = light_count
-    
+        if material is not self.bound_material: # consecutive render groups of the same material bind nothing
+            texture_arrays, _ = material.get_texture_arrays(self.texture_manager, self.shader_permutations)
+            for location, texture_array in enumerate(texture_arrays):
+                texture_array.use(location = location)
+            self.bound_material = material
+            self.draw_stats["material_binds"] += 1
+            self.draw_stats["texture_binds"] += len(texture_arrays)
+
+        # NOTE: the specialized shaders lack the uniforms they don't use, which the compiler would drop anyway
+        _, layers = material.get_texture_layout(self.shader_permutations)
+        uniforms = {'height_scale': material.height_scale}
+        for name, (location, layer) in layers.items():
+            uniforms['tex_' + name] = location
+            uniforms['layer_' + name] = layer
+        if self.shader_permutations:
+            uniforms.update(material.get_uniform_values())
+        for name, value in uniforms.items():
+            uniform = program.get(name, None)
+            if uniform is not None:
+                uniform.value = value
+
+    def prefetch_materials(self, materials: List[PBRMaterial]) -> None:
+        '''Decodes the maps of the materials in parallel, then uploads them, so that the first frames don't stall.'''
+        for material in materials:
+            material.prefetch(self.shader_permutations)
+        for material in materials:
+            material.get_texture_arrays(self.texture_manager, self.shader_permutations)
+
+    def get_light_cutoff(self) -> float:
+        '''light_cutoff, or by default the radiance whose tone mapped and gamma corrected value is half a step of 8 bit color.'''
+        if self.light_cutoff is not None:
+            return self.light_cutoff
+        return -np.log(1.0 - (0.5 / 255) ** 2.2) / self.exposure
+
+    def use_light_sources(self, lights: List[PointLight]):
+        # uploaded once per frame, shared by all the PBR programs
+        self.light_grid.update(self.frame, lights, self.fbo_hdr_msaa.size, self.get_light_cutoff())
+        self.light_grid.use()
+        self.perspective_uniforms.update(self.light_grid.get_uniforms())
+
+    @staticmethod
+    def has_pbr_family_member(mobject: Mobject) -> bool:
+        return any(isinstance(sm, PBRMobjectShaderCompatibilityMixin) for sm in mobject.get_family())
+
+    def get_render_group_list(self, mobject: Mobject) -> list[dict[str]] | map:
+        if not self.has_pbr_family_member(mobject):
+            return super().get_render_group_list(mobject)
+        return self.get_pbr_render_group_list(mobject)
+
+    def get_pbr_render_group_list(self, mobject: Mobject) -> list[dict[str]]:
+        if self.frustum_culling and not self.is_in_view(mobject):
+            pbr_family = [sm for sm in mobject.get_family() if isinstance(sm, PBRMobjectShaderCompatibilityMixin) and sm.has_points()]
+            result = []
+            for submobject in pbr_family:
+                # static batches keep their members, so that they aren't rebuilt as the camera moves, and are culled as a whole
+                if not self.add_to_static_batch(submobject, result):
+                    self.buffer_cache.keep(submobject)
+                    self.draw_stats["culled_mobjects"] += 1
+            return result
+        if isinstance(mobject, PBRMobjectShaderCompatibilityMixin):
+            if getattr(mobject, "lod", False) and mobject.has_points():
+                mobject.update_lod(self.get_pixel_extent(mobject))
+            result = []
+            if mobject.has_points() and not self.add_to_static_batch(mobject, result):
+                result.append(self.buffer_cache.get_render_group(mobject, self))
+                self.draw_stats["drawn_mobjects"] += 1
+        elif not self.has_pbr_family_member(mobject):
+            return list(super().get_render_group_list(mobject))
+        else:
+            result = [] # a group holding PBR mobjects (e.g. CubePBR), which has no points of its own
+        for submobject in mobject.submobjects:
+            result.extend(self.get_pbr_render_group_list(submobject))
+        return result
+
+    def is_in_view(self, mobject: Mobject) -> bool:
+        '''Whether the bounding box of the family of a mobject, grown by the height map displacement, may be in view.'''
+        return self.are_in_view(mobject.get_family())
+
+    def are_in_view(self, mobjects: List[Mobject]) -> bool:
+        if any(sm.is_fixed_in_frame for sm in mobjects):
+            return True
+        margin = max((sm.material.get_max_displacement() for sm in mobjects if isinstance(getattr(sm, "material", None), PBRMaterial)), default=0.0)
+        boxes = np.array([sm.get_bounding_box() for sm in mobjects])
+        return self.frame.is_box_in_view(boxes[:, 0].min(0), boxes[:, 2].max(0), margin)
+
+    def add_to_static_batch(self, mobject: Mobject, render_groups: list[dict[str]]) -> bool:
+        '''Puts a static mobject in its batch, returns False if it's not static. The first member of a batch leaves a
+        placeholder in `render_groups`, so that the batch is drawn where it would have been (see get_static_batch_render_groups).'''
+        key = self.static_batcher.add(mobject)
+        if key is None:
+            return False
+        if self.static_batcher.is_first_member(key, mobject):
+            render_groups.append({"static_batch": key})
+        return True
+
+    def get_static_batch_render_groups(self, render_groups: list[dict[str]]) -> list[dict[str]]:
+        '''Replaces the placeholders of the static batches with their render groups, dropping the batches out of view.'''
+        batches = self.static_batcher.get_render_groups(self)
+        result = []
+        for render_group in render_groups:
+            if "static_batch" not in render_group:
+                result.append(render_group)
+                continue
+            batch_render_group, members = batches[render_group["static_batch"]]
+            if self.frustum_culling and not self.are_in_view(members):
+                self.draw_stats["culled_mobjects"] += len(members)
+                continue
+            result.append(batch_render_group)
+            self.draw_stats["drawn_mobjects"] += len(members)
+            self.draw_stats["batched_mobjects"] += len(members)
+        return result
+
+    def get_pixel_extent(self, mobject: Mobject) -> float:
+        '''Largest on-screen dimension of the bounding box of a mobject, in pixels of the render targets.'''
+        box_min, _, box_max = mobject.get_bounding_box()
+        extent = self.frame.get_projected_extent(box_min, box_max)
+        return float(np.max(extent * np.array(self.get_render_size()) / 2))
+
+    def set_mobjects_as_static(self, *mobjects: Mobject) -> None:
+        # PBR mobjects are always kept in self.buffer_cache, no need to upload them again for each animation
+        super().set_mobjects_as_static(*(m for m in mobjects if not self.has_pbr_family_member(m)))
+        if self.static_batching:
+            self.static_batcher.set_static(*(
+                sm for m in mobjects for sm in m.get_family() if isinstance(sm, PBRMobjectShaderCompatibilityMixin)
+            ))
+
+    def release_static_mobjects(self) -> None:
+        super().release_static_mobjects()
+        self.static_batcher.release_static()
+
+    def release_pbr_resources(self) -> None:
+        self.static_batcher.release()
+        self.buffer_cache.release()
+        self.light_grid.release()
+        self.texture_manager.release()
+        release_solid_textures(self.ctx)
+        self.frame_readback.release()
+        if self.gpu_timer is not None:
+            self.gpu_timer.release()
+        self.release_render_targets()
+        self.program_cache.release()
+        self.id_to_shader_program = {}
+
+    def gpu_section(self, name: str):
+        return nullcontext() if self.gpu_timer is None else self.gpu_timer.section(name)
+
+    def get_gpu_timings(self, average: bool = False) -> dict[str, float]:
+        '''Milliseconds spent by the GPU in each pass of capture, in the last timed frame or on average.'''
+        if self.gpu_timer is None:
+            return {}
+        return self.gpu_timer.get_average_timings() if average else self.gpu_timer.get_timings()
+
+    def get_gl_resource_report(self) -> dict:
+        '''Count and bytes of the live GL objects of this camera's context (see GLResourceRegistry.get_report).'''
+        return gl_resources.get_report(self.ctx)
+
+    def init_bloom_targets(self, pw: int, ph: int) -> None:
+        self.mip_chain = [] # large to small
+        self.fbo_bloom = None
+        for mip_size_float, mip_size_int in self.get_bloom_mip_sizes(pw, ph):
+            mip_map = track_gl(self.ctx.texture(
+                size = mip_size_int,
+                components = 3, ##
+                internal_format = GL_R11F_G11F_B10F
+            ), self, nbytes = mip_size_int[0] * mip_size_int[1] * 4)
+            mip_map.repeat_x, mip_map.repeat_y = False, False
+            self.mip_chain.append((mip_size_float, mip_size_int, mip_map))
+        if self.mip_chain:
+            self.fbo_bloom = track_gl(self.ctx.framebuffer(
+                color_attachments = (self.mip_chain[0][-1],) # color attachment of fbo_bloom will change dynamically during rendering
+            ), self)
+
+    def release_render_targets(self) -> None:
+        '''Releases the framebuffers and their attachments created by init_pbr, its programs belong to program_cache.'''
+        release_quad_vaos(self.ctx) # they reference the programs below
+        for fbo in (self.fbo_hdr_msaa, self.fbo_hdr):
+            fbo.depth_attachment.release()
+            fbo.release()
+        if self.fbo_bloom is not None:
+            self.fbo_bloom.release()
+        self.hdr_color_buffer_msaa.release()
+        self.hdr_color_buffer.release()
+        for _, _, mip_map in self.mip_chain:
+            mip_map.release()
+
+    # Draw submission
+
+    def reset_draw_stats(self) -> None:
+        self.bound_material = None  # texture units may have been rebound by other passes since last frame
+        self.last_program = None
+        self.draw_stats = {
+            "draw_calls": 0,
+            "program_switches": 0,
+            "material_binds": 0,    # times a material's texture arrays got bound
+            "texture_binds": 0,
+            "drawn_mobjects": 0,    # PBR mobjects, see frustum_culling
+            "culled_mobjects": 0,
+            "drawn_instances": 0,   # copies drawn by instanced draw calls, see InstancedPBR
+            "batched_mobjects": 0,  # drawn as part of a static batch, see static_batching
+        }
+
+    @staticmethod
+    def is_pbr_render_group(render_group: dict[str]) -> bool:
+        return isinstance(render_group["shader_wrapper"], PBRShaderWrapper)
+
+    def sort_render_groups(self, render_groups: List[dict[str]]) -> List[dict[str]]:
+        '''Sorts each run of consecutive PBR render groups by program and material, so that they share binds.
+        Other render groups keep their place, since they may rely on the drawing order (blending, no depth test).'''
+        def sort_key(render_group):
+            return (render_group["prog"].glo, id(render_group["shader_wrapper"].material))
+
+        result, run = [], []
+        for render_group in render_groups:
+            if self.is_pbr_render_group(render_group):
+                run.append(render_group)
+            else:
+                result.extend(sorted(run, key=sort_key))
+                result.append(render_group)
+                run = []
+        result.extend(sorted(run, key=sort_key))
+        return result
+
     def render(self, render_group: dict[str]) -> None:
-        if isinstance(render_group["shader_wrapper"], PBRShaderWrapper):
+        if self.is_pbr_render_group(render_group):
             self.use_pbr_textures(render_group["prog"], render_group["shader_wrapper"].material)
-            self.use_light_sources(render_group["prog"], render_group["lights"])
-        super().render(render_group)
+        if render_group["prog"] is not self.last_program:
+            self.last_program = render_group["prog"]
+            self.draw_stats["program_switches"] += 1
+        self.draw_stats["draw_calls"] += 1
+        if render_group.get("instances") is None:
+            super().render(render_group)
+            return
+        # one draw call for all the copies of an InstancedPBR
+        shader_wrapper = render_group["shader_wrapper"]
+        self.set_shader_uniforms(render_group["prog"], shader_wrapper)
+        self.set_ctx_depth_test(shader_wrapper.depth_test)
+        render_group["vao"].render(int(shader_wrapper.render_primitive), instances=render_group["instances"])
+        self.draw_stats["drawn_instances"] += render_group["instances"]
 
     def capture(self, *mobjects: Mobject): # TODO: support light objects
         self.refresh_perspective_uniforms()
+        self.buffer_cache.begin_frame()
+        self.static_batcher.begin_frame()
+        self.texture_manager.begin_frame()
         
         self.fbo_hdr_msaa.use()
         # Fuck! this may change the readbuffer & drawbuffer in the background! equivelent to:
@@ -253,7 +593,7 @@ class PBRCamera(Camera):
         
         # render_texture_on_quad(
         #     self.ctx,
-        #     mobjects[-1].material.get_property_texture(self.ctx, "ao"),
+        #     mobjects[-1].material.get_property_texture(self.texture_manager, "ao"),
         #     self.fbo
         # )
         # program = get_quad_prog(self.ctx)
@@ -261,33 +601,47 @@ class PBRCamera(Camera):
         # render_quad(self.ctx, program)
         # return
 
-        lights = [mobject for mobject in mobjects if isinstance(mobject, PointLight)]
-        for mobject in mobjects:
-            if not isinstance(mobject, PointLight):
-                for render_group in self.get_render_group_list(mobject):
-                    render_group["lights"] = lights
-                    self.render(render_group)
+        with self.gpu_section("geometry"):
+            lights = [mobject for mobject in mobjects if isinstance(mobject, PointLight)]
+            self.use_light_sources(lights)
+
+            self.reset_draw_stats()
+            render_groups = [
+                render_group
+                for mobject in mobjects if not isinstance(mobject, PointLight)
+                for render_group in self.get_render_group_list(mobject)
+            ]
+            render_groups = self.get_static_batch_render_groups(render_groups)
+            for render_group in self.sort_render_groups(render_groups):
+                self.render(render_group)
+            self.buffer_cache.end_frame()
+            self.static_batcher.end_frame()
 
         glDisable(GL_DEPTH_TEST)
         
-        blit_fbo(self.ctx, self.fbo_hdr_msaa, self.fbo_hdr) # resolve from multisampling fbo into the normal fbo
+        with self.gpu_section("resolve"):
+            blit_fbo(self.ctx, self.fbo_hdr_msaa, self.fbo_hdr) # resolve from multisampling fbo into the normal fbo
         if self.bloom:
+            if not self.mip_chain: # bloom turned on after init_pbr
+                self.init_bloom_targets(*self.get_render_size())
             self.fbo_bloom.use() # glViewPort(self.mip_chain[0].viewport)
             self.hdr_color_buffer.use(location=0)
-            self.downsample_program["srcResolution"] = (self.pixel_width, self.pixel_height)
+            # the footprint of the first downsample matches the first mip, even when levels are skipped
+            self.downsample_program["srcResolution"] = tuple(2 * x for x in self.mip_chain[0][0])
             self.downsample_program["karis_average"] = 1 # enable karis average
 
             # down sample
             glDisable(GL_BLEND)
-            for mip_size_float, mip_size_int, mip_map in self.mip_chain:
-                self.fbo_bloom.viewport = (0, 0, *mip_size_int)
-                glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, mip_map.glo, 0)
-                
-                render_quad(self.ctx, self.downsample_program)
-                
-                mip_map.use(location=0)
-                self.downsample_program["srcResolution"] = mip_size_float
-                self.downsample_program["karis_average"] = 0
+            with self.gpu_section("bloom_downsample"):
+                for mip_size_float, mip_size_int, mip_map in self.mip_chain:
+                    self.fbo_bloom.viewport = (0, 0, *mip_size_int)
+                    glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, mip_map.glo, 0)
+                    
+                    render_quad(self.ctx, self.downsample_program)
+                    
+                    mip_map.use(location=0)
+                    self.downsample_program["srcResolution"] = mip_size_float
+                    self.downsample_program["karis_average"] = 0
 
             # up sample
             # Enable additive blending
@@ -295,22 +649,24 @@ class PBRCamera(Camera):
             glBlendFunc(GL_ONE, GL_ONE)
             glBlendEquation(GL_FUNC_ADD)
             
-            for this_mip, next_mip in zip(self.mip_chain[::-1], self.mip_chain[-2::-1]):
-                this_size_f, this_size_i, this_mip_map = this_mip
-                next_size_f, next_size_i, next_mip_map = next_mip
-                
-                this_mip_map.use(location=0)
-                self.fbo_bloom.viewport = (0, 0, *next_size_f)
-                glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, next_mip_map.glo, 0)
-                render_quad(self.ctx, self.upsample_program)
+            with self.gpu_section("bloom_upsample"):
+                for this_mip, next_mip in zip(self.mip_chain[::-1], self.mip_chain[-2::-1]):
+                    this_size_f, this_size_i, this_mip_map = this_mip
+                    next_size_f, next_size_i, next_mip_map = next_mip
+                    
+                    this_mip_map.use(location=0)
+                    self.fbo_bloom.viewport = (0, 0, *next_size_f)
+                    glFramebufferTexture2D(GL_FRAMEBUFFER, GL_COLOR_ATTACHMENT0, GL_TEXTURE_2D, next_mip_map.glo, 0)
+                    render_quad(self.ctx, self.upsample_program)
 
             glDisable(GL_BLEND)
 
             # final
             self.hdr_color_buffer.use(location=0)
             self.mip_chain[0][-1].use(location=1)
-            self.fbo.use()
-            render_quad(self.ctx, self.bloom_final_program)
+            self.fbo.use() # output size, hdr_color_buffer is upscaled by linear filtering when render_scale < 1
+            with self.gpu_section("tonemap"):
+                render_quad(self.ctx, self.bloom_final_program)
             
             self.set_ctx_blending(True) # restore blending
             glBlendEquation(GL_FUNC_ADD)
@@ -318,7 +674,24 @@ class PBRCamera(Camera):
         else:
             self.hdr_color_buffer.use()
             self.fbo.use()
-            render_quad(self.ctx, self.hdr_final_program)
+            with self.gpu_section("tonemap"):
+                render_quad(self.ctx, self.hdr_final_program)
+
+        if self.gpu_timer is not None:
+            if self.gpu_timing_overlay:
+                self.gpu_timer.draw_overlay(self.fbo, 1000 / self.frame_rate)
+            self.gpu_timer.end_frame()
+
+
+class PBRSceneFileWriter(StreamingSceneFileWriter):
+    '''Writes the frames read back asynchronously by PBRCamera, which reach the movie a few frames late.'''
+
+    def read_frames(self, camera: PBRCamera) -> List[bytes]:
+        return camera.read_frame_async(self.get_frame_dtype())
+
+    def close_movie_pipe(self) -> None:
+        self.write_raw_frames(self.scene.camera.flush_frame_readbacks())
+        super().close_movie_pipe()
 
 
 class PBRScene(Scene):
@@ -328,4 +701,56 @@ class PBRScene(Scene):
         "window_config": {
             "size": (1920 * 2, 1080 * 2)
         },
+        "frame_range": None, # (start, end) indices of the frames to render, the others only advance the timeline
+        "dry_run": False,    # advance the timeline without rendering anything, e.g. to count the frames
     }
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.file_writer = PBRSceneFileWriter(self, **self.file_writer_config)
+        self.frame_index = 0 # index of the next emitted frame
+
+    def should_render_frame(self) -> bool:
+        if self.dry_run:
+            return False
+        if self.frame_range is None:
+            return True
+        start, end = self.frame_range
+        return start <= self.frame_index < end
+
+    def update_frame(self, dt: float = 0, ignore_skipping: bool = False) -> None:
+        if ignore_skipping or self.should_render_frame():
+            super().update_frame(dt, ignore_skipping)
+        else:
+            self.increment_time(dt)
+            self.update_mobjects(dt)
+
+    def emit_frame(self) -> None:
+        if self.should_render_frame():
+            super().emit_frame()
+        self.frame_index += 1
+        if self.frame_range is not None and self.frame_index >= self.frame_range[1]:
+            raise EndSceneEarlyException() # nothing left to render
+
+    def prefetch_materials(self, *materials: PBRMaterial) -> None:
+        '''Loads the given materials, or the materials of every mobject in the scene, before animating. With the
+        shader_warm_up of the camera, also compiles the programs of the mobjects of the scene (only those using
+        the given materials, if any).'''
+        if self.camera.shader_warm_up:
+            if materials:
+                mobjects = [sm for mob in self.mobjects for sm in mob.get_family() if any(getattr(sm, "material", None) is m for m in materials)]
+            else:
+                mobjects = self.mobjects
+            self.camera.warm_up_programs(mobjects)
+        if not materials:
+            materials = [
+                sm.material for mob in self.mobjects for sm in mob.get_family()
+                if isinstance(getattr(sm, "material", None), PBRMaterial)
+            ]
+        self.camera.prefetch_materials(list({id(material): material for material in materials}.values()))
+
+    def tear_down(self) -> None:
+        super().tear_down() # the file writer still reads frames (pending readbacks, last frame)
+        self.camera.release_pbr_resources()
+        if self.camera.check_gl_leaks:
+            gl_resources.check_leaks(self.camera.ctx)
@@ -0,0 +1,49 @@
+import moderngl
+from collections import deque
+from typing import List, Tuple
+
+from manimgl_3d.utils.gl_resources import track_gl
+
+
+class PixelBufferRing:
+    '''Asynchronous framebuffer readback through a ring of pixel pack buffers.
+
+    Reading a framebuffer into a buffer only queues the copy on the GPU, so the pixels of a frame are
+    fetched (the buffer mapped) once `n_buffers - 1` more frames have been queued, by which time the copy
+    is normally done, instead of stalling the CPU right after rendering. Frames come out in order.'''
+
+    def __init__(self, ctx: moderngl.Context, n_buffers: int = 3):
+        self.ctx = ctx
+        self.n_buffers = max(1, n_buffers)
+        self.buffers: List[moderngl.Buffer] = []
+        self.pending: deque = deque() # buffers holding a frame not fetched yet, oldest first
+
+    def push(self, fbo: moderngl.Framebuffer, viewport: Tuple[int, int, int, int], components: int, dtype: str = 'f1') -> List[bytes]:
+        '''Queues the readback of `fbo`, returns the frames which had to be fetched to make room (oldest first).'''
+        size = viewport[2] * viewport[3] * components * int(dtype[1:])
+        if self.buffers and self.buffers[0].size != size: # the frame size changed
+            fetched = self.flush()
+            self.release()
+        else:
+            fetched = []
+        if not self.buffers:
+            self.buffers = [track_gl(self.ctx.buffer(reserve=size), self) for _ in range(self.n_buffers)]
+
+        if len(self.pending) == self.n_buffers:
+            fetched.append(self.pending.popleft().read())
+        buffer = next(buffer for buffer in self.buffers if buffer not in self.pending)
+        fbo.read_into(buffer, viewport=viewport, components=components, dtype=dtype)
+        self.pending.append(buffer)
+        return fetched
+
+    def flush(self) -> List[bytes]:
+        '''Fetches all the queued frames (oldest first).'''
+        fetched = [buffer.read() for buffer in self.pending]
+        self.pending.clear()
+        return fetched
+
+    def release(self) -> None:
+        for buffer in self.buffers:
+            buffer.release()
+        self.buffers = []
+        self.pending.clear()
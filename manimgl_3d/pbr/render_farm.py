@@ -0,0 +1,140 @@
+import importlib.util
+import inspect
+import multiprocessing
+import os
+import shutil
+import subprocess as sp
+import sys
+import tempfile
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import List, Optional, Tuple, Type
+
+from manimlib.constants import FFMPEG_BIN
+from manimlib.logger import log
+from manimlib.utils.config_ops import merge_dicts_recursively
+
+from manimgl_3d.pbr.pbr_scene import PBRScene
+
+
+def split_frames(total_frames: int, n_parts: int) -> List[Tuple[int, int]]:
+    '''Splits [0, total_frames) into at most `n_parts` contiguous (start, end) ranges of balanced lengths.'''
+    bounds = np.linspace(0, total_frames, n_parts + 1).round().astype(int)
+    return [(int(start), int(end)) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def get_scene_class_location(scene_class: Type[PBRScene]) -> Tuple[str, str]:
+    return os.path.abspath(inspect.getfile(scene_class)), scene_class.__qualname__
+
+def load_scene_class(module_path: str, class_name: str) -> Type[PBRScene]:
+    '''Imports a scene class from its file, reusing the module if it was already imported (e.g. as __mp_main__).'''
+    for module in list(sys.modules.values()):
+        if os.path.abspath(getattr(module, "__file__", None) or "") == module_path and hasattr(module, class_name):
+            return getattr(module, class_name)
+    spec = importlib.util.spec_from_file_location("_manimgl_3d_farm_scene_module", module_path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return getattr(module, class_name)
+
+def count_frames(scene_class: Type[PBRScene], scene_config: dict) -> int:
+    '''Runs the scene without rendering anything, and returns the number of frames it emits.'''
+    scene = scene_class(**merge_dicts_recursively(scene_config, {
+        "preview": False,
+        "dry_run": True,
+        "file_writer_config": {"write_to_movie": False, "save_last_frame": False, "quiet": True},
+    }))
+    scene.run()
+    return scene.frame_index
+
+def init_worker(threads_per_worker: int) -> None:
+    # keep software GL (llvmpipe) from spawning one thread per core in every worker
+    os.environ.setdefault("LP_NUM_THREADS", str(threads_per_worker))
+
+def render_frame_range(module_path: str, class_name: str, scene_config: dict, frame_range: Tuple[int, int], output_directory: str, file_name: str) -> str:
+    '''Worker: replays the timeline of the scene, only rendering and writing the frames in `frame_range`.'''
+    scene_class = load_scene_class(module_path, class_name)
+    scene = scene_class(**merge_dicts_recursively(scene_config, {
+        "preview": False,
+        "frame_range": frame_range,
+        "file_writer_config": {
+            "write_to_movie": True,
+            "break_into_partial_movies": False,
+            "save_last_frame": False,
+            "output_directory": output_directory,
+            "file_name": file_name,
+            "mirror_module_path": False,
+            "open_file_upon_completion": False,
+            "show_file_location_upon_completion": False,
+            "total_frames": 0,  # no progress bar per worker
+            "quiet": True,
+        },
+    }))
+    scene.run()
+    return scene.file_writer.get_movie_file_path()
+
+def concat_movies(movie_paths: List[str], output_path: str) -> None:
+    file_list = os.path.join(os.path.dirname(movie_paths[0]), "partial_movie_file_list.txt")
+    with open(file_list, 'w') as fp:
+        for path in movie_paths:
+            fp.write(f"file '{path.replace(os.sep, '/')}'\n")
+    sp.run([
+        FFMPEG_BIN,
+        '-y',  # overwrite output file if it exists
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', file_list,
+        '-loglevel', 'error',
+        '-c', 'copy',
+        '-an',
+        output_path
+    ], check=True)
+
+def render_scene_in_parallel(
+        scene_class: Type[PBRScene],
+        n_workers: Optional[int] = None,
+        output_path: Optional[str] = None,
+        **scene_config
+    ) -> str:
+    '''Renders a PBRScene into a movie with `n_workers` processes (one per core by default).
+
+    The frames are counted with a dry run, then each worker renders a contiguous frame range of the scene
+    with its own standalone context (set camera_config["standalone_backend"] = "egl" on headless Linux),
+    replaying the timeline before its range without rendering it. The partial movies are concatenated
+    without re-encoding. The scene must be deterministic (manimlib seeds the random generators) and
+    defined in an importable file. Sounds are not supported.
+
+    Returns the path of the movie, `output_path` or <SceneName>.mp4 in the working directory.'''
+    n_workers = n_workers or os.cpu_count() or 1
+    extension = scene_config.get("file_writer_config", {}).get("movie_file_extension", ".mp4")
+    output_path = os.path.abspath(output_path or scene_class.__name__ + extension)
+
+    total_frames = count_frames(scene_class, scene_config)
+    frame_ranges = split_frames(total_frames, n_workers)
+    if not frame_ranges:
+        raise ValueError(f"{scene_class.__name__} has no frames to render.")
+    log.info(f"Rendering {total_frames} frames of {scene_class.__name__} with {len(frame_ranges)} workers")
+
+    module_path, class_name = get_scene_class_location(scene_class)
+    work_dir = tempfile.mkdtemp(prefix=".manimgl_3d_farm_", dir=os.path.dirname(output_path))
+    try:
+        with ProcessPoolExecutor(
+            max_workers=len(frame_ranges),
+            mp_context=multiprocessing.get_context("spawn"), # GL contexts don't survive a fork
+            initializer=init_worker,
+            initargs=(max(1, (os.cpu_count() or 1) // len(frame_ranges)),),
+        ) as executor:
+            futures = {
+                executor.submit(render_frame_range, module_path, class_name, scene_config, frame_range, work_dir, f"{i:05}"): i
+                for i, frame_range in enumerate(frame_ranges)
+            }
+            movie_paths = [None] * len(frame_ranges)
+            for future in as_completed(futures):
+                i = futures[future]
+                movie_paths[i] = future.result()
+                log.info(f"Frames {frame_ranges[i][0]}-{frame_ranges[i][1] - 1} rendered")
+        concat_movies(movie_paths, output_path)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    log.info(f"File ready at {output_path}")
+    return output_path
@@ -0,0 +1,124 @@
+import numpy as np
+from manimlib import Mobject
+from typing import Optional
+
+from manimgl_3d.pbr.buffer_cache import PBRBufferCache
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from manimgl_3d.pbr.pbr_scene import PBRCamera
+
+
+def get_uniforms_key(uniforms: dict) -> tuple:
+    '''Hashable key of uniform values, arrays being compared by shape and values rather than by their repr.'''
+    return tuple(
+        (name, np.shape(value), tuple(np.asarray(value, dtype=float).flatten().tolist()))
+        if isinstance(value, (np.ndarray, list, tuple)) else (name, value)
+        for name, value in sorted(uniforms.items())
+    )
+
+
+class StaticBatcher:
+    '''Merges the static PBR mobjects sharing a material (and a shader program and uniforms) into a single
+    vertex and index buffer, drawn with one draw call per batch, where its first member would have been drawn.
+
+    Mobjects become static through PBRCamera.set_mobjects_as_static, i.e. while an animation doesn't move
+    them. A batch is only rebuilt when its members change, or when the data arrays of one of them do
+    (by their versions, like PBRBufferCache). Batches which got no member during a frame are released.'''
+
+    def __init__(self, buffer_cache: PBRBufferCache):
+        self.buffer_cache = buffer_cache
+        self.static_ids: set[int] = set()
+        self.batches: dict[tuple, dict] = {}    # batch key -> entry
+        self.members: dict[tuple, list] = {}    # batch key -> mobjects added during the current frame
+
+    @staticmethod
+    def is_batchable(mobject: Mobject) -> bool:
+        # instanced mobjects have their own per-instance buffers
+        return mobject.has_points() and getattr(mobject, "instance_dtype", None) is None
+
+    def set_static(self, *mobjects: Mobject) -> None:
+        self.static_ids.update(id(mobject) for mobject in mobjects if self.is_batchable(mobject))
+
+    def release_static(self) -> None:
+        self.static_ids = set()
+
+    # Frame life cycle
+
+    def begin_frame(self) -> None:
+        self.members = {}
+
+    def add(self, mobject: Mobject) -> Optional[tuple]:
+        '''Puts a static mobject in its batch for this frame, returns the key of the batch, or None if it's not static.'''
+        if id(mobject) not in self.static_ids:
+            return None
+        shader_wrapper = mobject.shader_wrapper
+        key = (
+            id(shader_wrapper.material),
+            shader_wrapper.program_id,
+            get_uniforms_key(mobject.get_shader_uniforms()),
+            mobject.depth_test,
+            shader_wrapper.render_primitive,
+        )
+        self.members.setdefault(key, []).append(mobject)
+        return key
+
+    def is_first_member(self, key: tuple, mobject: Mobject) -> bool:
+        return self.members[key][0] is mobject
+
+    def end_frame(self) -> None:
+        for key in [key for key in self.batches if key not in self.members]:
+            self.release_batch(self.batches.pop(key))
+
+    def release(self) -> None:
+        for batch in self.batches.values():
+            self.release_batch(batch)
+        self.batches = {}
+
+    def release_batch(self, batch: dict) -> None:
+        self.buffer_cache.release_entry(batch)
+
+    # Render groups
+
+    def get_render_groups(self, camera: "PBRCamera") -> dict[tuple, tuple[dict, list[Mobject]]]:
+        '''Batch key -> (render group, members) of every batch filled during this frame.'''
+        result = {}
+        for key, members in self.members.items():
+            batch = self.batches.get(key)
+            member_ids = [id(mobject) for mobject in members]
+            if batch is None or batch["member_ids"] != member_ids:
+                batch = self.batches[key] = self.rebuild(batch, members, camera)
+            else:
+                changed = [self.update_versions(batch["versions"].setdefault(id(mobject), {}), mobject) for mobject in members]
+                if any(changed):
+                    self.batches[key] = batch = self.rebuild(batch, members, camera)
+            result[key] = (batch["render_group"], members)
+        return result
+
+    def update_versions(self, seen: dict, mobject: Mobject) -> bool:
+        dirty_keys, indices_changed = self.buffer_cache.update_versions(seen, mobject, self.buffer_cache.get_source_keys(mobject))
+        return bool(dirty_keys) or indices_changed
+
+    def rebuild(self, batch: dict | None, members: list[Mobject], camera: "PBRCamera") -> dict:
+        if batch is not None:
+            self.release_batch(batch)
+        shader_data, indices, n_vertices = [], [], 0
+        versions = {}
+        for mobject in members:
+            self.update_versions(versions.setdefault(id(mobject), {}), mobject)
+            data = mobject.get_shader_data()
+            mobject_indices = mobject.get_shader_vert_indices()
+            if mobject_indices is None:
+                mobject_indices = np.arange(len(data))
+            shader_data.append(np.array(data))
+            indices.append(np.asarray(mobject_indices).flatten() + n_vertices)
+            n_vertices += len(data)
+
+        shader_wrapper = members[0].shader_wrapper
+        shader_wrapper.uniforms = members[0].get_shader_uniforms()
+        shader_wrapper.depth_test = members[0].depth_test
+        program, _ = camera.get_shader_program(shader_wrapper)
+        render_group = self.buffer_cache.create_render_group(
+            shader_wrapper, program, np.concatenate(shader_data), np.concatenate(indices)
+        )
+        return {"member_ids": [id(mobject) for mobject in members], "versions": versions, "render_group": render_group}
@@ -4,18 +4,33 @@ from .pbr_scene import *
 from .material import *
 from manimgl_3d.shader_compatibility import *
 from manimgl_3d.utils.model_utils import *
+from manimgl_3d.utils.surface_utils import get_uv_grid, evaluate_uv_func, get_grid_triangle_indices
 
 class PointLight(Point):
     # NOTE: this is only a container, and should never be rendered as a mobject
     CONFIG = {
         "light_color": np.array([1000.0, 1000.0, 1000.0]),
+        # distance beyond which the light is ignored, what tiled light culling relies on. None: as far as the light is
+        # visible (see PBRCamera.get_light_cutoff), which leaves the image unchanged. A finite radius is an opt-in
+        # approximation: the light then fades out smoothly up to it (see pbr/frag.glsl)
+        "light_radius": None,
     }
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.light_color = np.array(self.light_color, dtype=float) # CONFIG's array is shared by all the instances
+
     def set_light_color(self, light_color: np.ndarray) -> None:
         assert light_color.shape == (3,)
         self.light_color[:] = light_color[:]
 
     def get_light_color(self) -> np.ndarray:
         return self.light_color
+
+    def get_light_radius(self, cutoff: float) -> float:
+        if self.light_radius is not None:
+            return self.light_radius
+        # radiance = light_color / distance^2 falls below the cutoff
+        return np.sqrt(max(np.max(self.light_color), 0.0) / cutoff)
     
     # make sure this is not rendered
     def get_shader_wrapper_list(self):
@@ -37,11 +52,26 @@ class SurfacePBR(PBRMobjectShaderCompatibilityMixin, Surface): # MobjectShaderCo
         "shader_dtype": [
             ('point', np.float32, (3,)),
             ('normal', np.float32, (3,)),
-            ('tangent', np.float32, (3,)),
+            ('tangent', np.float32, (4,)),    # w: handedness of the bitangent (see compute_tangent_frames)
             ('tex_coords', np.float32, (2,)),
         ],
+        # data arrays each shader attribute is derived from, so that PBRCamera only re-uploads what changed
+        "shader_data_sources": {
+            "point": ("points",),
+            "normal": ("points",),
+            "tangent": ("points",),
+            "tex_coords": ("tex_coords",),
+        },
         "material": default_material,
         "tex_coords_scale": (1.0, 1.0), # u, v  # should remain constant
+        "vectorized_uv_func": False, # set True if uv_func accepts whole arrays of u, v (much faster for large resolutions)
+        "analytic_derivatives": False, # set True to nudge the points along uv_func_du/uv_func_dv instead of finite differences
+        # level of detail: coarser grids, drawn from a subset of the same vertices, for surfaces covering few pixels
+        "lod": True,
+        "lod_pixels_per_segment": 1.0,  # on-screen extent (in pixels) per grid segment the level is chosen for
+        "lod_hysteresis": 0.5,          # in levels, how far past its threshold a coarser level must be before switching to it
+        "lod_height_map_bias": 1.0,     # in levels, finer grids for displaced (height mapped) surfaces
+        "lod_max_level": 6,             # the coarsest level keeps every 2^lod_max_level-th row and column
     }
 
     def init_data(self):
@@ -50,9 +80,47 @@ class SurfacePBR(PBRMobjectShaderCompatibilityMixin, Surface): # MobjectShaderCo
             "bounding_box": np.zeros((3, 3)),
             "tex_coords": np.zeros((0, 2))
         }
+        self.normal_tangent_cache = None # (version of the points it was computed from, normal, tangent)
 
     def init_colors(self):
         pass
+
+    def compute_triangle_indices(self):
+        super().compute_triangle_indices()
+        # chain of index buffers, level k keeps every 2^k-th row and column of the grid
+        resolution = tuple(self.resolution)
+        self.lod_chain = [self.triangle_indices]
+        while len(self.lod_chain) <= self.lod_max_level and min(resolution) > 2 ** len(self.lod_chain):
+            self.lod_chain.append(get_grid_triangle_indices(resolution, 2 ** len(self.lod_chain)))
+        self.lod_level = 0
+
+    def update_lod(self, pixel_extent: float) -> None:
+        '''Picks the level of detail for a surface spanning `pixel_extent` pixels on screen. A finer level is picked
+        right away, a coarser one only once it's `lod_hysteresis` levels past its threshold, so that it doesn't flicker.'''
+        max_level = len(self.lod_chain) - 1
+        if not pixel_extent > 0:    # nothing on screen (zero, or NaN), the coarsest level
+            self.lod_level = max_level
+            return
+        if not np.isfinite(pixel_extent): # the surface reaches the camera, the finest level
+            self.lod_level = 0
+            return
+        n_segments = max(max(self.resolution) - 1, 1)
+        ideal = np.log2(n_segments * self.lod_pixels_per_segment / pixel_extent)
+        if self.material.get_max_displacement() > 0:
+            ideal -= self.lod_height_map_bias
+        ideal = float(np.clip(ideal, -1, max_level + self.lod_hysteresis + 1))
+        if np.floor(ideal) < self.lod_level:
+            self.lod_level = max(int(np.floor(ideal)), 0)
+        elif np.floor(ideal - self.lod_hysteresis) > self.lod_level:
+            self.lod_level = min(int(np.floor(ideal - self.lod_hysteresis)), max_level)
+
+    def get_shader_vert_indices(self) -> np.ndarray:
+        return self.lod_chain[self.lod_level] if self.lod else self.triangle_indices
+
+    def sort_faces_back_to_front(self, vect: np.ndarray = OUT):
+        super().sort_faces_back_to_front(vect) # in place
+        self.note_changed_data("__indices__")
+        return self
     
     def init_uniforms(self):
         self.uniforms= {
@@ -60,33 +128,66 @@ class SurfacePBR(PBRMobjectShaderCompatibilityMixin, Surface): # MobjectShaderCo
         }
 
     def init_points(self):
-        super().init_points()
-        
-        # init tex_coords
-        nu, nv = self.resolution
-        su, sv = self.tex_coords_scale
-        tex_coords = np.array([
-                [u, v]
-                for u in np.linspace(0, su, nu)
-                for v in np.linspace(sv, 0, nv)  # Reverse y-direction
-            ])
-        self.data["tex_coords"] = tex_coords
+        u_values, v_values, tex_coords = get_uv_grid(
+            tuple(self.resolution), tuple(self.u_range), tuple(self.v_range), tuple(self.tex_coords_scale)
+        )
+
+        if self.analytic_derivatives:
+            # the nudged points follow the exact partial derivatives, which are then transformed along with the points
+            eps = self.epsilon
+            points = self.evaluate_uv_function(self.uv_func, u_values, v_values)
+            du_points = points + eps * self.evaluate_uv_function(self.uv_func_du, u_values, v_values)
+            dv_points = points + eps * self.evaluate_uv_function(self.uv_func_dv, u_values, v_values)
+            self.set_points(np.vstack([points, du_points, dv_points]))
+        elif self.vectorized_uv_func:
+            # points, du-nudged points and dv-nudged points, evaluated in one single call
+            eps = self.epsilon
+            points = evaluate_uv_func(
+                self.uv_func,
+                np.hstack([u_values, u_values + eps, u_values]),
+                np.hstack([v_values, v_values, v_values + eps]),
+                self.dim
+            )
+            self.set_points(points)
+        else:
+            super().init_points() # calls uv_func once per sample
+
+        self.data["tex_coords"] = tex_coords.copy() # the cached grid is shared and read-only
+
+    def evaluate_uv_function(self, func: Callable, u_values: np.ndarray, v_values: np.ndarray) -> np.ndarray:
+        if self.vectorized_uv_func:
+            return evaluate_uv_func(func, u_values, v_values, self.dim)
+        return np.array([func(u, v) for u, v in zip(u_values, v_values)], dtype=float).reshape(-1, self.dim)
 
     def calculate_normal_and_tangent(self, s_points, du_points, dv_points):
         normal = np.cross((du_points - s_points), (dv_points - s_points))
         tangent = (du_points - s_points)
         return normal, tangent
 
+    def get_normal_and_tangent(self):
+        '''Normals and tangents of the surface points, only recomputed when the points changed.'''
+        version = self.data.versions["points"] # see VersionedData
+        cache = self.normal_tangent_cache
+        if cache is None or cache[0] != version:
+            cache = (version, *self.calculate_normal_and_tangent(*self.get_surface_points_and_nudged_points()))
+            self.normal_tangent_cache = cache
+        return cache[1], cache[2]
+
     def get_tex_coords(self):
         return self.data["tex_coords"]
 
     def get_shader_data(self):
-        s_points, du_points, dv_points = self.get_surface_points_and_nudged_points()
+        s_points, _, _ = self.get_surface_points_and_nudged_points()
         shader_data = self.get_resized_shader_data_array(len(s_points))
         
         if "points" not in self.locked_data_keys:
             shader_data["point"] = s_points
-            shader_data["normal"], shader_data["tangent"] = self.calculate_normal_and_tangent(s_points, du_points, dv_points)
+            normal, tangent = self.get_normal_and_tangent()
+            # the texture coordinates run along u and against v (see get_uv_grid), so the handedness is -1
+            su, sv = np.sign(self.tex_coords_scale)
+            shader_data["normal"] = normal
+            shader_data["tangent"][:, :3] = su * tangent
+            shader_data["tangent"][:, 3] = -su * sv
 
         if "tex_coords" not in self.locked_data_keys:
             shader_data["tex_coords"] = self.get_tex_coords()
@@ -100,6 +201,8 @@ class SpherePBR(SurfacePBR):
         "radius": 1,
         "u_range": (0, TAU),
         "v_range": (0, PI),
+        "vectorized_uv_func": True,
+        "analytic_derivatives": True,
     }
 
     def uv_func(self, u: float, v: float):
@@ -109,13 +212,29 @@ class SpherePBR(SurfacePBR):
             -np.cos(v)
         ])
 
+    def uv_func_du(self, u: float, v: float):
+        return self.radius * np.array([
+            -np.sin(u) * np.sin(v),
+            np.cos(u) * np.sin(v),
+            np.zeros_like(v)
+        ])
+
+    def uv_func_dv(self, u: float, v: float):
+        return self.radius * np.array([
+            np.cos(u) * np.cos(v),
+            np.sin(u) * np.cos(v),
+            np.sin(v)
+        ])
+
 
 class SquarePBR(SurfacePBR):
     CONFIG = {
         "side_length": 2,
         "u_range": (-1, 1),
         "v_range": (-1, 1),
-        "resolution": (2, 2)
+        "resolution": (2, 2),
+        "vectorized_uv_func": True,
+        "analytic_derivatives": True,
     }
 
     def init_points(self) -> None:
@@ -123,7 +242,13 @@ class SquarePBR(SurfacePBR):
         self.scale(self.side_length / 2)
 
     def uv_func(self, u: float, v: float) -> np.ndarray:
-        return np.array([u, v, 0])
+        return np.array([u, v, np.zeros_like(u)])
+
+    def uv_func_du(self, u: float, v: float) -> np.ndarray:
+        return np.array([np.ones_like(u), np.zeros_like(u), np.zeros_like(u)])
+
+    def uv_func_dv(self, u: float, v: float) -> np.ndarray:
+        return np.array([np.zeros_like(u), np.ones_like(u), np.zeros_like(u)])
 
 
 class CubePBR(SGroup): # not a SurfacePBR, but with SurfacePBR submobjects
@@ -169,20 +294,22 @@ class ModelPBR(PBRMobjectShaderCompatibilityMixin, Mobject):
         "shader_dtype": [
             ('point', np.float32, (3,)),
             ('normal', np.float32, (3,)),
-            ('tangent', np.float32, (3,)),
+            ('tangent', np.float32, (4,)),    # w: handedness of the bitangent (see compute_tangent_frames)
             ('tex_coords', np.float32, (2,)),
         ],
+        "shader_data_sources": {
+            "point": ("points",),
+            "normal": ("normal",),
+            "tangent": ("tangent", "handedness"),
+            "tex_coords": ("tex_coords",),
+        },
         "material": default_material,
+        "use_mesh_cache": True, # see load_mesh_arrays
     }
 
     def __init__(self, model_path, *args, **kwargs):
         super().__init__(*args, **kwargs)
-
-        model = trimesh.load_mesh(model_path, process=True)
-        if isinstance(model, trimesh.Scene):
-            model = trimesh.util.concatenate(model.dump())
-        
-        self.init_model(model)
+        self.init_mesh_arrays(load_mesh_arrays(model_path, use_cache=self.use_mesh_cache))
 
     # Initializers, only run once
 
@@ -191,6 +318,7 @@ class ModelPBR(PBRMobjectShaderCompatibilityMixin, Mobject):
             "points": np.zeros((0, 3)),
             "normal": np.zeros((0, 3)),
             "tangent": np.zeros((0, 3)),
+            "handedness": np.zeros((0, 1)),
             "bounding_box": np.zeros((3, 3)),
             "tex_coords": np.zeros((0, 2))
         }
@@ -199,27 +327,17 @@ class ModelPBR(PBRMobjectShaderCompatibilityMixin, Mobject):
         pass
 
     def init_model(self, model: trimesh.Trimesh):
-        
         # Parsing the model and compute necessary data
-        
-        vertices = model.vertices
-        face_indices = model.faces
-        normals = model.vertex_normals
-
-        if hasattr(model.visual, 'uv') and model.visual.uv is not None:
-            tex_coords = model.visual.uv
-        else:
-            tex_coords = np.zeros((len(model.vertices), 2))
+        self.init_mesh_arrays(get_mesh_arrays(model))
 
-        tangents = compute_tangents(vertices, tex_coords, normals, face_indices)
-        
+    def init_mesh_arrays(self, arrays: dict[str, np.ndarray]):
         # Initalize mobject data
-        
-        self.set_points(vertices)
-        self.data["normal"] = np.copy(normals)              # copy makes sure the array is editable
-        self.data["tangent"] = np.copy(tangents)
-        self.data["tex_coords"] = np.copy(tex_coords)
-        self.shader_indices = face_indices
+        self.set_points(arrays["vertices"])
+        self.data["normal"] = np.array(arrays["normals"])              # copy makes sure the array is editable
+        self.data["tangent"] = np.array(arrays["tangents"])
+        self.data["handedness"] = np.array(arrays["handedness"]).reshape(-1, 1)
+        self.data["tex_coords"] = np.array(arrays["tex_coords"])
+        self.shader_indices = np.array(arrays["faces"])
 
     # Methods directly affecting points
     
@@ -231,12 +349,16 @@ class ModelPBR(PBRMobjectShaderCompatibilityMixin, Mobject):
         works_on_bounding_box: bool = False
     ):
         super().apply_points_function(func, about_point, about_edge, works_on_bounding_box)
+        ends = func(np.vstack([np.zeros(3), np.identity(3)]))
+        if np.linalg.det(ends[1:] - ends[0]) < 0:                   # mirrored, e.g. stretch(-1, dim), so are the bitangents
+            self.data["handedness"] *= -1
         extra_arrs = [self.get_normal(), self.get_tangent()]        # the function also applies to normals and tangents
         for arr in extra_arrs:
             if about_point is None:
                 arr[:] = func(arr)
             else:
                 arr[:] = func(arr - about_point) + about_point
+        self.note_changed_data("normal", "tangent")
     
     # Getters, called during run-time
 
@@ -245,6 +367,9 @@ class ModelPBR(PBRMobjectShaderCompatibilityMixin, Mobject):
     
     def get_tangent(self):
         return self.data["tangent"]
+
+    def get_handedness(self):
+        return self.data["handedness"]
     
     def get_tex_coords(self):
         return self.data["tex_coords"]
@@ -256,9 +381,164 @@ class ModelPBR(PBRMobjectShaderCompatibilityMixin, Mobject):
         if "points" not in self.locked_data_keys:
             shader_data["point"] = points
             shader_data["normal"] = self.get_normal()
-            shader_data["tangent"] = self.get_tangent()
+            shader_data["tangent"][:, :3] = -self.get_tangent() # along 1 - u, as the texture coordinates below
+            shader_data["tangent"][:, 3] = self.get_handedness()[:, 0]
 
         if "tex_coords" not in self.locked_data_keys:
             shader_data["tex_coords"] = np.array([1., 1.]) - self.get_tex_coords()
         
         return shader_data
+
+class InstancedPBR(PBRMobjectShaderCompatibilityMixin, Mobject):
+    '''Copies of one mesh (a SurfacePBR or a ModelPBR), drawn with a single instanced draw call.
+
+    The mesh is uploaded once. Each instance draws it at `basis @ point + offset`, with its own albedo tint and
+    roughness factor, kept in data["points"] (offsets), data["instance_basis"] (3x3 matrices, flattened) and
+    data["instance_material"] (r, g, b, roughness), so that moving all the instances costs a single upload of
+    the instance buffer per frame. The mesh is copied as it is when passed, transforms apply to the instances.'''
+    CONFIG = {
+        "shader_folder": "pbr",
+        "shader_defines": ("INSTANCED",),
+        "render_primitive": moderngl.TRIANGLES,
+        "depth_test": True,
+        "shader_dtype": [
+            ('point', np.float32, (3,)),
+            ('normal', np.float32, (3,)),
+            ('tangent', np.float32, (4,)),    # w: handedness of the bitangent (see compute_tangent_frames)
+            ('tex_coords', np.float32, (2,)),
+        ],
+        "instance_dtype": [
+            ('instance_offset', np.float32, (3,)),
+            ('instance_basis', np.float32, (9,)),     # column-major, as GLSL reads a mat3
+            ('instance_material', np.float32, (4,)),
+        ],
+        "shader_data_sources": {
+            "point": ("mesh_point",),
+            "normal": ("mesh_normal",),
+            "tangent": ("mesh_tangent",),
+            "tex_coords": ("mesh_tex_coords",),
+            "instance_offset": ("points",),
+            "instance_basis": ("instance_basis",),
+            "instance_material": ("instance_material",),
+        },
+        "material": default_material, # the mesh's if not given
+    }
+
+    def __init__(self, mesh: SurfacePBR | ModelPBR, offsets: np.ndarray, **kwargs):
+        kwargs.setdefault("material", mesh.material)
+        super().__init__(**kwargs)
+        self.init_mesh(mesh)
+        self.set_instances(offsets)
+
+    # Initializers, only run once
+
+    def init_data(self):
+        self.data: dict[str, np.ndarray] = {
+            "points": np.zeros((0, 3)),
+            "bounding_box": np.zeros((3, 3)),
+            "instance_basis": np.zeros((0, 9)),
+            "instance_material": np.zeros((0, 4)),
+            "mesh_point": np.zeros((0, 3)),
+            "mesh_normal": np.zeros((0, 3)),
+            "mesh_tangent": np.zeros((0, 4)),
+            "mesh_tex_coords": np.zeros((0, 2)),
+        }
+        self.mesh_radius = 0.0
+
+    def init_colors(self):
+        pass
+
+    def init_shader_data(self):
+        super().init_shader_data()
+        self.instance_data = np.zeros(0, dtype=self.instance_dtype)
+
+    def init_mesh(self, mesh: SurfacePBR | ModelPBR):
+        shader_data = mesh.get_shader_data()
+        for name in ("point", "normal", "tangent", "tex_coords"):
+            self.data["mesh_" + name] = np.array(shader_data[name], dtype=np.float64)
+        self.shader_indices = np.array(mesh.get_shader_vert_indices())
+        self.mesh_radius = float(np.max(np.linalg.norm(self.data["mesh_point"], axis=1), initial=0.0))
+
+    # Instances
+
+    def set_instances(self, offsets: np.ndarray, bases: np.ndarray | None = None, materials: np.ndarray | None = None):
+        '''Replaces the instances by len(offsets) new ones, with identity bases and neutral materials by default.'''
+        offsets = np.array(offsets, dtype=np.float64).reshape(-1, 3)
+        self.data["instance_basis"] = np.tile(np.identity(3).flatten(), (len(offsets), 1))
+        self.data["instance_material"] = np.ones((len(offsets), 4))
+        self.set_points(offsets)
+        if bases is not None:
+            self.set_instance_bases(bases)
+        if materials is not None:
+            self.set_instance_materials(materials)
+        return self
+
+    def get_num_instances(self) -> int:
+        return len(self.get_points())
+
+    def get_instance_offsets(self) -> np.ndarray:
+        return self.get_points()
+
+    def get_instance_bases(self) -> np.ndarray:
+        return self.data["instance_basis"].reshape(-1, 3, 3)
+
+    def set_instance_offsets(self, offsets: np.ndarray):
+        self.set_points(np.reshape(offsets, (-1, 3)))
+        return self
+
+    def set_instance_bases(self, bases: np.ndarray):
+        self.data["instance_basis"][:] = np.reshape(bases, (-1, 9))
+        self.note_changed_data("instance_basis")
+        self.refresh_bounding_box()
+        return self
+
+    def set_instance_materials(self, materials: np.ndarray):
+        '''Albedo tints (r, g, b) and roughness factors, (n, 4) or (4,) for all the instances.'''
+        self.data["instance_material"][:] = materials
+        self.note_changed_data("instance_material")
+        return self
+
+    # Methods directly affecting points
+
+    def apply_points_function(
+        self,
+        func: Callable[[np.ndarray], np.ndarray],
+        about_point: np.ndarray = None,
+        about_edge: np.ndarray = ORIGIN,
+        works_on_bounding_box: bool = False
+    ):
+        if about_point is None and about_edge is not None:
+            about_point = self.get_bounding_box_point(about_edge)
+        # offsets move with func, its linear part (func being affine, as for shift, scale and rotate) goes to the bases
+        ends = func(np.vstack([np.zeros(3), np.identity(3)]))
+        linear = (ends[1:] - ends[0]).T
+        bases = self.get_instance_bases()
+        bases[:] = linear @ bases
+        self.note_changed_data("instance_basis")
+        return super().apply_points_function(func, about_point, about_edge, works_on_bounding_box)
+
+    def compute_bounding_box(self) -> np.ndarray:
+        offsets = self.get_points()
+        if len(offsets) == 0:
+            return np.zeros((3, 3))
+        # |basis @ point| <= |basis|_F * |point|, so each instance lies in a ball around its offset
+        radii = self.mesh_radius * np.linalg.norm(self.data["instance_basis"], axis=1)[:, np.newaxis]
+        mins, maxs = (offsets - radii).min(0), (offsets + radii).max(0)
+        return np.array([mins, (mins + maxs) / 2, maxs])
+
+    # Getters, called during run-time
+
+    def get_shader_data(self):
+        shader_data = self.get_resized_shader_data_array(len(self.data["mesh_point"]))
+        for name in ("point", "normal", "tangent", "tex_coords"):
+            shader_data[name] = self.data["mesh_" + name]
+        return shader_data
+
+    def get_instance_data(self) -> np.ndarray:
+        n = self.get_num_instances()
+        if len(self.instance_data) != n:
+            self.instance_data = np.zeros(n, dtype=self.instance_dtype)
+        self.instance_data["instance_offset"] = self.get_points()
+        self.instance_data["instance_basis"] = self.get_instance_bases().transpose(0, 2, 1).reshape(n, 9)
+        self.instance_data["instance_material"] = self.data["instance_material"]
+        return self.instance_data
@@ -0,0 +1,101 @@
+import moderngl
+import weakref
+from collections import OrderedDict
+from typing import Callable, Hashable, Tuple, Optional
+
+from manimgl_3d.utils.gl_resources import track_gl
+from manimgl_3d.utils.gl_utils import get_solid_texture_stats
+
+
+class TextureManager:
+    '''Owns the material textures of one context.
+
+    Textures are shared by key (built from the content of the material properties), and each texture
+    counts the materials referencing it. The total size of the resident textures is kept under `budget`
+    bytes (None for no limit) by evicting textures in least-recently-used order: first the ones no
+    material references any more, then the ones not used during the current frame, which are simply
+    reloaded if needed again. Textures used during the current frame are never evicted.'''
+
+    def __init__(self, ctx: moderngl.Context, budget: Optional[int] = None):
+        self.ctx = ctx
+        self.budget = budget
+        self.entries: "OrderedDict[Hashable, dict]" = OrderedDict() # least recently used first
+        self.frame = 0
+        self.stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "resident_bytes": 0,
+            "peak_bytes": 0,
+        }
+
+    def begin_frame(self) -> None:
+        self.frame += 1
+
+    def get(
+            self,
+            key: Hashable,
+            loader: Callable[[moderngl.Context], Tuple[moderngl.Texture, int]],
+            owner: object = None
+        ) -> moderngl.Texture:
+        '''Returns the texture of `key`, creating it with `loader(ctx) -> (texture, size_in_bytes)` on a miss.
+        `owner` (usually a PBRMaterial) is counted as a reference until `release_owner` is called.'''
+        entry = self.entries.get(key)
+        if entry is None:
+            self.stats["misses"] += 1
+            texture, nbytes = loader(self.ctx)
+            track_gl(texture, self, nbytes)
+            entry = {"texture": texture, "nbytes": nbytes, "owners": weakref.WeakSet(), "last_frame": self.frame}
+            self.entries[key] = entry
+            self.stats["resident_bytes"] += nbytes
+            self.stats["peak_bytes"] = max(self.stats["peak_bytes"], self.stats["resident_bytes"])
+            self.evict()
+        else:
+            self.stats["hits"] += 1
+            self.entries.move_to_end(key)
+
+        entry["last_frame"] = self.frame
+        if owner is not None:
+            entry["owners"].add(owner) # weakly, a material collected without release_owner drops its references
+        return entry["texture"]
+
+    def get_ref_count(self, key: Hashable) -> int:
+        entry = self.entries.get(key)
+        return 0 if entry is None else len(entry["owners"])
+
+    def evict(self) -> None:
+        if self.budget is None:
+            return
+        for referenced in (False, True):
+            for key in list(self.entries):
+                if self.stats["resident_bytes"] <= self.budget:
+                    return
+                entry = self.entries[key]
+                if bool(entry["owners"]) == referenced and entry["last_frame"] != self.frame:
+                    self.release_entry(key)
+                    self.stats["evictions"] += 1
+
+    def release_entry(self, key: Hashable) -> None:
+        entry = self.entries.pop(key)
+        entry["texture"].release()
+        self.stats["resident_bytes"] -= entry["nbytes"]
+
+    def release_owner(self, owner: object) -> None:
+        '''Drops the references of `owner`, its textures become the first candidates for eviction.'''
+        for entry in self.entries.values():
+            entry["owners"].discard(owner)
+        self.evict()
+
+    def release(self) -> None:
+        '''Releases all the textures, called when the scene is torn down.'''
+        for key in list(self.entries):
+            self.release_entry(key)
+
+    def get_stats(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {
+            **self.stats,
+            "textures": len(self.entries),
+            "hit_rate": self.stats["hits"] / lookups if lookups else 0.0,
+            "solid_textures": get_solid_texture_stats(self.ctx), # the 1x1 constant textures, pooled apart
+        }
@@ -6,25 +6,56 @@ import OpenGL.GL as gl
 from .mobject_rt import *
 from manimgl_3d.shader_compatibility import get_shader_code_from_file_extended
 from manimgl_3d.camera_frame import MyCameraFrame
+from manimgl_3d.frame_writer import StreamingSceneFileWriter
+from manimgl_3d.gpu_timer import GPUTimer
+from contextlib import nullcontext
+from manimgl_3d.utils.gl_resources import track_gl, gl_resources
+from manimgl_3d.utils.shader_cache import ShaderProgramCache
+from manimgl_3d.utils.directories_utils import enable_driver_shader_cache
 
 class RTCamera(Camera):
     CONFIG = {
-        "rtshader_folder" : "ray_tracing" # the folder containing vert/frag shaders for ray tracing
+        "rtshader_folder" : "ray_tracing", # the folder containing vert/frag shaders for ray tracing
+        "standalone_backend": None,    # backend of the standalone context when there's no window, e.g. 'egl' on headless Linux
+        "gpu_timing": False,           # time each pass of capture with GL timer queries (see GPUTimer)
+        "gpu_timing_overlay": False,   # draw the average pass timings as a bar at the bottom of the frame
+        "driver_shader_cache": False,  # point the disk cache of the driver to the manimgl_3d cache directory (see enable_driver_shader_cache)
     }
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         
+        self.program_cache = ShaderProgramCache(self.ctx)
         self._init_rtshader_program()
         self._init_quad()
+        self.gpu_timer = GPUTimer(self.ctx) if self.gpu_timing else None
     
     def init_frame(self) -> None:
         self.frame = MyCameraFrame(**self.frame_config)
 
+    def get_shader_program(self, shader_wrapper: ShaderWrapper) -> tuple[moderngl.Program, str]:
+        sid = shader_wrapper.get_program_id()
+        if sid not in self.id_to_shader_program:
+            program = self.program_cache.get(**shader_wrapper.get_program_code())
+            self.id_to_shader_program[sid] = (program, moderngl.detect_format(program, shader_wrapper.vert_attributes))
+        return self.id_to_shader_program[sid]
+
+    def init_context(self, ctx: moderngl.Context | None = None) -> None:
+        if self.driver_shader_cache:
+            enable_driver_shader_cache()
+        if ctx is not None or self.standalone_backend is None:
+            return super().init_context(ctx)
+        ctx = moderngl.create_standalone_context(backend=self.standalone_backend)
+        self.ctx = ctx
+        self.fbo = self.get_fbo(ctx, 0)
+        self.set_ctx_blending()
+        self.fbo_msaa = self.get_fbo(ctx, self.samples) # same as Camera.init_context
+        self.fbo_msaa.use()
+
     def _init_rtshader_program(self):
         def get_code(name):
             return get_shader_code_from_file_extended(os.path.join(self.rtshader_folder, f"{name}.glsl"))
-        self.rtprogram =  self.ctx.program(
+        self.rtprogram = self.program_cache.get(
                 vertex_shader = get_code("vert"),
                 geometry_shader = get_code("geom"),
                 fragment_shader = get_code("frag"),
@@ -43,13 +74,30 @@ class RTCamera(Camera):
             1.0, -1.0,
             -1.0, -1.0,
         ], dtype = 'f4')
-        vbo = self.ctx.buffer(coords.tobytes())
+        self.quad_vbo = track_gl(self.ctx.buffer(coords.tobytes()), self)
 
-        self.quad_vao = self.ctx.vertex_array(
+        self.quad_vao = track_gl(self.ctx.vertex_array(
             self.rtprogram ,
-            [(vbo, "2f", "coords")] # attributes of vertex shader
-        )
-        # FIX: these vao and vbo are never released from memory, will it cause issue? 
+            [(self.quad_vbo, "2f", "coords")] # attributes of vertex shader
+        ), self)
+
+    def release_rt_resources(self) -> None:
+        '''Releases the raytracing quad and the programs, called when the scene is torn down.'''
+        self.quad_vao.release()
+        self.quad_vbo.release()
+        self.program_cache.release()
+        self.id_to_shader_program = {}
+        if self.gpu_timer is not None:
+            self.gpu_timer.release()
+
+    def gpu_section(self, name: str):
+        return nullcontext() if self.gpu_timer is None else self.gpu_timer.section(name)
+
+    def get_gpu_timings(self, average: bool = False) -> dict[str, float]:
+        '''Milliseconds spent by the GPU in each pass of capture, in the last timed frame or on average.'''
+        if self.gpu_timer is None:
+            return {}
+        return self.gpu_timer.get_average_timings() if average else self.gpu_timer.get_timings()
 
     def set_rt_shader_uniforms(self, mobjects_rt: List[MobjectRT]) :
         shader: moderngl.Program = self.rtprogram
@@ -73,25 +121,33 @@ class RTCamera(Camera):
         # draw the RayTracing quad
         self.set_ctx_depth_test(False)
         self.set_rt_shader_uniforms(mobjects_rt)
-        self.quad_vao.render(moderngl.TRIANGLE_STRIP)
+        with self.gpu_section("raytrace"):
+            self.quad_vao.render(moderngl.TRIANGLE_STRIP)
         
         # draw depth masks (of the RTMobject)
         self.set_ctx_depth_test(True)
         gl.glColorMask(False, False, False, False)
         
-        for mobject_rt in mobjects_rt:
-            depth_mask: Mobject = mobject_rt.depth_mask
-            # TODO, lock the static RTmobjects to avoid creating 
-            # a new group of vao/vbo any single frame.
-            get_render_group_list = map(self.get_render_group, depth_mask.get_shader_wrapper_list())
-            for render_group in get_render_group_list:
-                self.render_mask(render_group)
+        with self.gpu_section("depth_masks"):
+            for mobject_rt in mobjects_rt:
+                depth_mask: Mobject = mobject_rt.depth_mask
+                # TODO, lock the static RTmobjects to avoid creating 
+                # a new group of vao/vbo any single frame.
+                get_render_group_list = map(self.get_render_group, depth_mask.get_shader_wrapper_list())
+                for render_group in get_render_group_list:
+                    self.render_mask(render_group)
         
         # draw the non-rt mobjects
         gl.glColorMask(True, True, True, True)
-        for mobject in mobjects:
-            for render_group in self.get_render_group_list(mobject):
-                self.render(render_group)
+        with self.gpu_section("mobjects"):
+            for mobject in mobjects:
+                for render_group in self.get_render_group_list(mobject):
+                    self.render(render_group)
+
+        if self.gpu_timer is not None:
+            if self.gpu_timing_overlay:
+                self.gpu_timer.draw_overlay(self.fbo, 1000 / self.frame_rate)
+            self.gpu_timer.end_frame()
 
     def render_mask(self, render_group: dict[str]) -> None:
         shader_wrapper = render_group["shader_wrapper"]
@@ -107,6 +163,7 @@ class RTScene(Scene):
     }
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.file_writer = StreamingSceneFileWriter(self, **self.file_writer_config)
         self.mobjects_rt: list[MobjectRT] = []
     
     def remove_rt(self, *mobjects_rt_to_remove: MobjectRT):
@@ -165,5 +222,11 @@ class RTScene(Scene):
         """
         self.camera.release_static_mobjects()
         
-        # FIX, I dont think it appropriate to release the quad vao for rt here
-        # since they are still needed till the end of the scene.
\ No newline at end of file
+        # NOTE: the quad vao for rt is still needed till the end of the scene,
+        # it is released in tear_down instead.
+
+    def tear_down(self) -> None:
+        super().tear_down()
+        self.camera.release_rt_resources()
+        for owner in (self.camera, self.camera.program_cache):
+            gl_resources.check_leaks(self.camera.ctx, owner=owner)
\ No newline at end of file
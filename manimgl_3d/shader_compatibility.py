@@ -1,23 +1,33 @@
 # Some tedious yet essential compatiblity utils, bridging manimgl_3d and manimlib.
 
+import itertools
+from functools import wraps
 from manimlib import *
 from manimgl_3d.utils.directories_utils import get_manimgl_3d_shader_dir
 
 __all__ = [
     "get_shader_code_from_file_extended",
+    "insert_shader_defines",
     "MyShaderWrapper",
     "MobjectShaderCompatibilityMixin",
     "VMobjectShaderCompatibilityMixin",
     "PBRShaderWrapper",
+    "VersionedData",
     "PBRMobjectShaderCompatibilityMixin"
 ]
 
 filename_to_code_map = {} # caching seperately, avoiding fetching wrong files
 
-# exactly copied expect one line
-def get_shader_code_from_file_extended(filename: str) -> str | None:
+# exactly copied expect one line, and the permutations
+def get_shader_code_from_file_extended(filename: str, defines: tuple[str, ...] = ()) -> str | None:
     if not filename:
         return None
+    if defines:
+        # a permutation of the shader, selected by #ifdef on these flags, and cached by them (its feature key)
+        key = (filename, tuple(defines))
+        if key not in filename_to_code_map:
+            filename_to_code_map[key] = insert_shader_defines(get_shader_code_from_file_extended(filename), key[1])
+        return filename_to_code_map[key]
     if filename in filename_to_code_map:
         return filename_to_code_map[filename]
 
@@ -50,6 +60,14 @@ def get_shader_code_from_file_extended(filename: str) -> str | None:
     return result
 
 
+def insert_shader_defines(code: str | None, defines: tuple[str, ...]) -> str | None:
+    # right after the #version line, which must come first
+    if code is None or not defines:
+        return code
+    version, _, rest = code.partition("\n")
+    return "\n".join([version, *(f"#define {define}" for define in defines), rest])
+
+
 # This will search the manimgl_3d/shader folder while fetching shader code file
 class MyShaderWrapper(ShaderWrapper):
     def init_program_code(self) -> None:
@@ -93,16 +111,94 @@ class VMobjectShaderCompatibilityMixin:
         )
 
 class PBRShaderWrapper(MyShaderWrapper):
-    def __init__(self, material, **kwargs):
+    def __init__(self, material, defines: tuple[str, ...] = (), **kwargs):
+        self.defines = tuple(defines) # preprocessor flags selecting a variant of the shaders, e.g. INSTANCED
         super().__init__(**kwargs)
         self.material = material
 
+    def init_program_code(self) -> None:
+        self.program_code = self.get_variant_program_code()
+
+    def get_variant_program_code(self, defines: tuple[str, ...] = ()) -> dict[str, str | None]:
+        '''Code of the permutation with the flags of this wrapper and `defines`, e.g. those of its material.'''
+        defines = (*self.defines, *defines)
+        return {
+            f"{stage}_shader": get_shader_code_from_file_extended(os.path.join(self.shader_folder, f"{name}.glsl"), defines)
+            for stage, name in (("vertex", "vert"), ("geometry", "geom"), ("fragment", "frag"))
+        }
+
+data_versions = itertools.count(1) # shared by every mobject, so that a version is never seen twice
+
+class VersionedData(dict):
+    '''The data dict of a PBR mobject, with a version per key, bumped whenever the key is assigned or
+    note_changed is called for it. The buffer caches compare versions instead of the arrays themselves.'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.versions: dict[str, int] = {}
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, key: str, value: np.ndarray) -> None:
+        super().__setitem__(key, value)
+        self.note_changed(key)
+
+    def update(self, *args, **kwargs) -> None:
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def __reduce__(self):
+        # copies and pickles get fresh versions
+        return (VersionedData, (dict(self),))
+
+    def note_changed(self, *keys: str) -> None:
+        for key in keys:
+            self.versions[key] = next(data_versions)
+
+def note_changed_family_points(apply_points_function: Callable) -> Callable:
+    # the points of the whole family are edited in place, also from a parent which isn't a PBR mobject (e.g. a Group)
+    @wraps(apply_points_function)
+    def wrapper(self, *args, **kwargs):
+        result = apply_points_function(self, *args, **kwargs)
+        for mob in self.get_family():
+            if isinstance(mob.data, VersionedData):
+                mob.data.note_changed("points", "bounding_box")
+        return result
+    return wrapper
+
+Mobject.apply_points_function = note_changed_family_points(Mobject.apply_points_function)
+
 class PBRMobjectShaderCompatibilityMixin:
+    # NOTE: the arrays of self.data are edited in place by manimlib (set_points, apply_points_function, interpolate),
+    # those methods are wrapped to bump their versions, other in-place edits must call note_changed_data
+
+    @property
+    def data(self) -> VersionedData:
+        return self._data
+
+    @data.setter
+    def data(self, data: dict) -> None:
+        self._data = VersionedData(data)
+
+    def note_changed_data(self, *keys: str) -> None:
+        '''Bumps the version of data arrays edited in place, or of "__indices__" for the vertex indices.'''
+        self.data.note_changed(*keys)
+
+    def set_points(self, points):
+        super().set_points(points)
+        self.note_changed_data("points")
+        return self
+
+    def interpolate(self, mobject1, mobject2, alpha, *args, **kwargs):
+        super().interpolate(mobject1, mobject2, alpha, *args, **kwargs)
+        self.note_changed_data(*(key for key in self.data if key not in self.locked_data_keys))
+        return self
+
     def init_shader_data(self):
         self.shader_data = np.zeros(len(self.get_points()), dtype=self.shader_dtype)
         self.shader_indices = None
         self.shader_wrapper = PBRShaderWrapper(
             material = self.material,
+            defines=getattr(self, "shader_defines", ()),
             vert_data=self.shader_data,
             shader_folder=self.shader_folder,
             texture_paths=self.texture_paths,
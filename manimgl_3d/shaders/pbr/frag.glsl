@@ -2,32 +2,61 @@
 
 const float PI = 3.14159265359;
 
-#define MAX_LIGHTS 16
+#define LIGHT_TEXTURE_WIDTH 1024            // must match manimgl_3d/pbr/lighting.py
 
 // From Vertex Shader
 in vec3 WorldPos;
 in vec3 Normal;
-in vec3 Tangent;
+in vec4 Tangent; // w: handedness
 in vec2 tex_coords_v;
-
-// From Camera
-uniform vec3 light_positions[MAX_LIGHTS];
+#ifdef INSTANCED
+in vec4 instance_material_v;                // albedo tint (rgb), roughness factor
+#endif
+
+// From Camera (see LightGrid)
+uniform sampler2D light_data;               // 2 texels per light: (position, radius), (color, windowed)
+uniform isampler2D light_tiles;             // (offset, count) of the light list of each screen tile
+uniform isampler2D light_indices;           // light lists of all the tiles, one after another
+uniform int light_tile_size;                // in pixels
 uniform vec3 light_source_position;         // NOT USED, left for compatibility with non-PBR mobjects
-uniform vec3 light_colors[MAX_LIGHTS];
-uniform int light_count;
 uniform vec3 camera_position;
-uniform float bloom_threshold;
 
 // PBR textures (from SurfacePBR.material -> shaderwrapper -> PBRCamera)
-uniform sampler2D tex_albedo;
-uniform sampler2D tex_roughness;
-uniform sampler2D tex_metallic;
-uniform sampler2D tex_ao;
-uniform sampler2D tex_normal;
-
-
-layout (location = 0) out vec4 FragColor; // render into hdr_color_buffer
-layout (location = 1) out vec4 BrightColor; // render into hdr_bright_buffer
+// Maps of the same size share one texture array (see PBRMaterial.get_texture_arrays)
+// Constant properties are uniforms instead, in the variants defining CONSTANT_<PROPERTY> (see PBRMaterial.get_shader_defines)
+#ifdef CONSTANT_ALBEDO
+uniform vec3 value_albedo;
+#else
+uniform sampler2DArray tex_albedo;
+uniform int layer_albedo;
+#endif
+#ifdef CONSTANT_ROUGHNESS
+uniform float value_roughness;
+#else
+uniform sampler2DArray tex_roughness;
+uniform int layer_roughness;
+#endif
+#ifdef CONSTANT_METALLIC
+uniform float value_metallic;
+#else
+uniform sampler2DArray tex_metallic;
+uniform int layer_metallic;
+#endif
+#ifdef CONSTANT_AO
+uniform float value_ao;
+#else
+uniform sampler2DArray tex_ao;
+uniform int layer_ao;
+#endif
+#if defined(CONSTANT_NORMAL) && !defined(FLAT_NORMAL)
+uniform vec3 value_normal;
+#elif !defined(CONSTANT_NORMAL)
+uniform sampler2DArray tex_normal;
+uniform int layer_normal;
+#endif
+
+
+layout (location = 0) out vec4 FragColor; // render into hdr_color_buffer, bloom is extracted from it afterwards
 
 float DistributionGGX(vec3 N, vec3 H, float roughness)
 {
@@ -71,20 +100,52 @@ vec3 fresnelSchlick(float cosTheta, vec3 F0)
 
 vec3 getNewNormal(vec3 mapNormal)
 {
-    vec3 Bitangent = cross(Tangent, Normal);
-    mat3 tbn = mat3(Tangent, Bitangent, Normal);
+    // along the second texture coordinate, the handedness accounting for mirrored uvs (see compute_tangent_frames)
+    vec3 Bitangent = Tangent.w * cross(Normal, Tangent.xyz);
+    mat3 tbn = mat3(Tangent.xyz, Bitangent, Normal);
     return normalize(tbn * mapNormal);
 }
 
-void main()
+ivec2 light_texel(int k)
 {
-    vec3 albedo = pow(texture(tex_albedo, tex_coords_v).rgb, vec3(2.2)); // from sRGB to linear space
-    float roughness = texture(tex_roughness, tex_coords_v).r;
-    float metallic = texture(tex_metallic, tex_coords_v).r;
-    float ao = texture(tex_ao, tex_coords_v).r;
-    vec3 map_normal = texture(tex_normal, tex_coords_v).rgb * 2.0 - 1.0;
+    return ivec2(k % LIGHT_TEXTURE_WIDTH, k / LIGHT_TEXTURE_WIDTH);
+}
 
+void main()
+{
+#ifdef CONSTANT_ALBEDO
+    vec3 albedo = pow(value_albedo, vec3(2.2)); // from sRGB to linear space
+#else
+    vec3 albedo = pow(texture(tex_albedo, vec3(tex_coords_v, layer_albedo)).rgb, vec3(2.2)); // from sRGB to linear space
+#endif
+#ifdef CONSTANT_ROUGHNESS
+    float roughness = value_roughness;
+#else
+    float roughness = texture(tex_roughness, vec3(tex_coords_v, layer_roughness)).r;
+#endif
+#ifdef INSTANCED
+    albedo *= instance_material_v.rgb;
+    roughness = clamp(roughness * instance_material_v.a, 0.0, 1.0);
+#endif
+#ifdef CONSTANT_METALLIC
+    float metallic = value_metallic;
+#else
+    float metallic = texture(tex_metallic, vec3(tex_coords_v, layer_metallic)).r;
+#endif
+#ifdef CONSTANT_AO
+    float ao = value_ao;
+#else
+    float ao = texture(tex_ao, vec3(tex_coords_v, layer_ao)).r;
+#endif
+
+#if defined(FLAT_NORMAL)
+    vec3 N = normalize(Normal); // the normal map is (0, 0, 1) in tangent space
+#elif defined(CONSTANT_NORMAL)
+    vec3 N = getNewNormal(value_normal * 2.0 - 1.0);
+#else
+    vec3 map_normal = texture(tex_normal, vec3(tex_coords_v, layer_normal)).rgb * 2.0 - 1.0;
     vec3 N = getNewNormal(map_normal);
+#endif
     vec3 V = normalize(camera_position - WorldPos);
 
     vec3 F0 = vec3(0.04);                      // for dia-electric (like plastic)
@@ -93,14 +154,26 @@ void main()
     // reflectance equation
     vec3 Lo = vec3(0.0);
 
-    for (int i = 0; i < light_count; i++)
+    // only the lights overlapping the screen tile of this fragment
+    ivec2 tile = min(ivec2(gl_FragCoord.xy) / light_tile_size, textureSize(light_tiles, 0) - 1);
+    ivec2 tile_lights = texelFetch(light_tiles, tile, 0).rg;
+
+    for (int i = tile_lights.x; i < tile_lights.x + tile_lights.y; i++)
     {
+        int light = texelFetch(light_indices, light_texel(i), 0).r;
+        vec4 light_position = texelFetch(light_data, light_texel(2 * light), 0); // w: radius
+        vec4 light_color = texelFetch(light_data, light_texel(2 * light + 1), 0); // w: 1 if the radius was set explicitly
+
+        float distance = length(light_position.xyz - WorldPos);
+        if (distance > light_position.w) continue;
+
         // calculate per-light radiance
-        vec3 L = normalize(light_positions[i] - WorldPos);
+        vec3 L = normalize(light_position.xyz - WorldPos);
         vec3 H = normalize(V + L);
-        float distance = length(light_positions[i] - WorldPos);
-        float attenuation = 1.0 / (distance * distance);
-        vec3 radiance = light_colors[i] * attenuation;
+        // fades out smoothly at an explicit radius, a derived one is where the light is no longer visible anyway
+        float window = light_color.w > 0.0 ? clamp(1.0 - pow(distance / light_position.w, 4.0), 0.0, 1.0) : 1.0;
+        float attenuation = window * window / (distance * distance);
+        vec3 radiance = light_color.rgb * attenuation;
 
         // Cook-Torrance BRDF
         float NDF = DistributionGGX(N, H, roughness);   
@@ -135,12 +208,5 @@ void main()
 
     vec3 color = ambient + Lo;
 
-    FragColor = vec4(color, 1.0); //
-
-    bool exceed_brightness = dot(color, vec3(0.2126, 0.7152, 0.0722)) > bloom_threshold;
-    if (exceed_brightness){
-        BrightColor = FragColor;
-    } else {
-        BrightColor = vec4(0.0, 0.0, 0.0, 1.0);
-    }
+    FragColor = vec4(color, 1.0);
 }
\ No newline at end of file
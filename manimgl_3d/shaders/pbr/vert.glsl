@@ -5,18 +5,33 @@ uniform float relative_focal_distance;
 uniform mat4 view;
 uniform float height_scale;
 
-uniform sampler2D tex_height;
+// no displacement at all in the NO_DISPLACEMENT variant, a uniform one with CONSTANT_HEIGHT (see PBRMaterial.get_shader_defines)
+#if defined(CONSTANT_HEIGHT) && !defined(NO_DISPLACEMENT)
+uniform float value_height;
+#elif !defined(CONSTANT_HEIGHT)
+uniform sampler2DArray tex_height;
+uniform int layer_height;
+#endif
 
 in vec3 point;
 // in vec3 du_point;
 // in vec3 dv_point;
 in vec3 normal;
-in vec3 tangent;
+in vec4 tangent;                            // w: handedness of the bitangent (see getNewNormal in frag.glsl)
 in vec2 tex_coords;
 
+#ifdef INSTANCED
+// Per instance (see InstancedPBR): the mesh is drawn at instance_basis * point + instance_offset
+in vec3 instance_offset;
+in mat3 instance_basis;
+in vec4 instance_material;                  // albedo tint (rgb), roughness factor
+
+out vec4 instance_material_v;
+#endif
+
 out vec3 WorldPos;
 out vec3 Normal;
-out vec3 Tangent;
+out vec4 Tangent;
 out vec2 tex_coords_v;
 
 const float DEFAULT_FRAME_HEIGHT = 8.0;
@@ -59,20 +74,40 @@ vec3 get_surface_unit_normal_vector(vec3 point, vec3 du_point, vec3 dv_point){
 void main(){
     tex_coords_v = tex_coords;
 
-    WorldPos = point;
+#ifdef INSTANCED
+    vec3 world_point = instance_basis * point + instance_offset;
+    vec3 world_normal = transpose(inverse(instance_basis)) * normal; // normals don't follow non-uniform scaling
+    vec3 world_tangent = instance_basis * tangent.xyz;
+    float handedness = tangent.w * sign(determinant(instance_basis)); // mirrored instances flip it
+    instance_material_v = instance_material;
+#else
+    vec3 world_point = point;
+    vec3 world_normal = normal;
+    vec3 world_tangent = tangent.xyz;
+    float handedness = tangent.w;
+#endif
+
+    WorldPos = world_point;
 
     // Normal = get_surface_unit_normal_vector(point, du_point, dv_point);
-    Normal = normalize(normal);
+    Normal = normalize(world_normal);
     
     // Gram–Schmidt process
     // Tangent = normalize(du_point - point);
     // Tangent = normalize(Tangent - dot(Tangent, Normal) * Normal);
-    Tangent = normalize(tangent);
+    Tangent = vec4(normalize(world_tangent), handedness);
     
-    float height = texture(tex_height, tex_coords).r;
-
     // Emit gl position
-    emit_gl_Position(point + Normal * height * height_scale);
+#if defined(NO_DISPLACEMENT)
+    emit_gl_Position(world_point);
+#else
+#ifdef CONSTANT_HEIGHT
+    float height = value_height;
+#else
+    float height = texture(tex_height, vec3(tex_coords, layer_height)).r;
+#endif
+    emit_gl_Position(world_point + Normal * height * height_scale);
+#endif
 
     // if(clip_plane.xyz != vec3(0.0, 0.0, 0.0)){
     //     gl_ClipDistance[0] = dot(vec4(point, 1.0), clip_plane);
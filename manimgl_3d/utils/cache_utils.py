@@ -0,0 +1,98 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+import numpy as np
+from typing import Callable, Dict, Optional
+
+from manimgl_3d.utils.directories_utils import get_manimgl_3d_cache_dir
+
+# NOTE: the budget is per namespace ("textures", "meshes"...), in MB, and can be set with MANIMGL_3D_CACHE_SIZE
+DEFAULT_CACHE_SIZE = 2048
+
+
+def get_file_hash(path: str, *salt: str) -> str:
+    '''Hash of the content of a file, and of the `salt` strings (cache format version, import options...).'''
+    sha1 = hashlib.sha1("\0".join(salt).encode())
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def get_cache_budget() -> int:
+    '''Bytes each namespace of the array cache may take on disk (see evict_cached_arrays).'''
+    return int(float(os.environ.get("MANIMGL_3D_CACHE_SIZE", DEFAULT_CACHE_SIZE)) * 2**20)
+
+def load_cached_arrays(namespace: str, key: str, compute: Callable[[], Dict[str, np.ndarray]]) -> Dict[str, np.ndarray]:
+    '''Returns the arrays cached under `namespace/key`, computing and saving them (one .npy file each) on a miss.
+    The arrays are always memory-mapped from the cache, so they are read-only: copy them before editing.
+
+    A hit refreshes the modification time of the entry, and a miss evicts the least recently used entries of the
+    namespace beyond its budget (see evict_cached_arrays). The whole cache is removed with clear_cache.'''
+    cache_dir = os.path.join(get_manimgl_3d_cache_dir(namespace), key)
+    if not os.path.isdir(cache_dir):
+        arrays = compute()
+        # write into a temporary directory first, so that a concurrent or interrupted render never sees a partial entry
+        tmp_dir = tempfile.mkdtemp(dir=os.path.dirname(cache_dir), prefix=".tmp")
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, name + ".npy"), np.ascontiguousarray(array))
+        try:
+            os.rename(tmp_dir, cache_dir)
+        except OSError: # written by another process in the meantime
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        evict_cached_arrays(namespace, keep=key)
+    else:
+        try:
+            os.utime(cache_dir)
+        except OSError:
+            if not os.path.isdir(cache_dir): # evicted by another process in the meantime
+                return load_cached_arrays(namespace, key, compute)
+
+    return {
+        name[:-len(".npy")]: np.load(os.path.join(cache_dir, name), mmap_mode='r')
+        for name in os.listdir(cache_dir) if name.endswith(".npy")
+    }
+
+def get_dir_size(path: str) -> int:
+    with os.scandir(path) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
+
+def evict_cached_arrays(namespace: str, max_bytes: Optional[int] = None, keep: Optional[str] = None) -> int:
+    '''Removes the least recently used entries of a namespace (by modification time) until it takes at most
+    `max_bytes` on disk (get_cache_budget() if None), never the entry `keep`. Returns the bytes removed.
+
+    Temporary directories left by interrupted writes are removed after a day. Entries still memory-mapped by
+    another process stay readable by it on POSIX systems, and are skipped where they can't be removed.'''
+    if max_bytes is None:
+        max_bytes = get_cache_budget()
+    namespace_dir = get_manimgl_3d_cache_dir(namespace)
+    entries, total, removed = [], 0, 0
+    with os.scandir(namespace_dir) as dir_entries:
+        for entry in dir_entries:
+            if not entry.is_dir():
+                continue
+            try:
+                mtime, size = entry.stat().st_mtime, get_dir_size(entry.path)
+            except OSError: # removed by another process in the meantime
+                continue
+            if entry.name.startswith(".tmp"):
+                if mtime < time.time() - 24 * 3600:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            entries.append((mtime, size, entry.name))
+            total += size
+    for mtime, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        shutil.rmtree(os.path.join(namespace_dir, name), ignore_errors=True)
+        total -= size
+        removed += size
+    return removed
+
+def clear_cache(*namespaces: str) -> None:
+    '''Removes the on-disk caches of manimgl_3d, only those of `namespaces` if given (e.g. "textures", "meshes").'''
+    for path in [get_manimgl_3d_cache_dir(namespace) for namespace in namespaces] or [get_manimgl_3d_cache_dir()]:
+        shutil.rmtree(path, ignore_errors=True)
@@ -8,4 +8,22 @@ def get_manimgl_3d_dir() -> str:
     return os.path.abspath(manimgl_3d_dir)
 
 def get_manimgl_3d_shader_dir():
-    return os.path.join(get_manimgl_3d_dir(), "shaders")
\ No newline at end of file
+    return os.path.join(get_manimgl_3d_dir(), "shaders")
+
+def get_manimgl_3d_cache_dir(*subdirs: str) -> str:
+    '''Directory of the on-disk caches, `~/.cache/manimgl_3d` unless the MANIMGL_3D_CACHE_DIR environment variable is set.'''
+    cache_dir = os.environ.get("MANIMGL_3D_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "manimgl_3d")
+    cache_dir = os.path.join(cache_dir, *subdirs)
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+def enable_driver_shader_cache() -> None:
+    '''Points the disk caches of the Mesa and NVIDIA drivers to the manimgl_3d cache directory, unless they're
+    set already. Opt-in, called by the cameras whose driver_shader_cache is set.
+
+    NOTE: Mesa reads it when the first display is opened, which importing manimlib does (pyglet). Once that's
+    done, it only applies to the child processes, e.g. the workers of render_scene_in_parallel.'''
+    os.environ.setdefault("MESA_SHADER_CACHE_DIR", get_manimgl_3d_cache_dir("shaders", "mesa"))
+    os.environ.setdefault("__GL_SHADER_DISK_CACHE", "1")
+    os.environ.setdefault("__GL_SHADER_DISK_CACHE_PATH", get_manimgl_3d_cache_dir("shaders", "nvidia"))
+    os.environ.setdefault("__GL_SHADER_DISK_CACHE_SKIP_CLEANUP", "1")
@@ -0,0 +1,178 @@
+import os
+import sys
+import weakref
+import moderngl as mgl
+from collections import defaultdict
+from typing import List, Optional
+
+from manimlib.logger import log
+
+# bytes per component of the moderngl dtypes
+DTYPE_SIZES = {'f1': 1, 'u1': 1, 'i1': 1, 'f2': 2, 'u2': 2, 'i2': 2, 'f4': 4, 'u4': 4, 'i4': 4}
+
+
+def get_gl_object_kind(obj) -> str:
+    return {
+        mgl.Buffer: "buffer",
+        mgl.Texture: "texture",
+        mgl.TextureArray: "texture",
+        mgl.Texture3D: "texture",
+        mgl.TextureCube: "texture",
+        mgl.Renderbuffer: "renderbuffer",
+        mgl.Framebuffer: "framebuffer",
+        mgl.VertexArray: "vertex_array",
+        mgl.Program: "program",
+    }.get(type(obj), type(obj).__name__.lower())
+
+def get_gl_object_nbytes(obj) -> int:
+    '''Size of the storage of a GL object, without mipmaps. Framebuffers, vertex arrays and programs own no storage.'''
+    if isinstance(obj, mgl.Buffer):
+        return obj.size
+    if isinstance(obj, (mgl.Texture, mgl.TextureArray, mgl.Texture3D, mgl.Renderbuffer)):
+        n_texels = 1
+        for length in obj.size:
+            n_texels *= length
+        samples = max(1, getattr(obj, "samples", 0))
+        return n_texels * obj.components * DTYPE_SIZES.get(obj.dtype, 4) * samples
+    if isinstance(obj, mgl.TextureCube):
+        return obj.size[0] * obj.size[1] * 6 * obj.components * DTYPE_SIZES.get(obj.dtype, 4)
+    return 0
+
+def is_gl_object_released(attributes: dict) -> bool:
+    '''From the attributes of the object (see GLResourceRegistry.track), release() replaces its mglo.'''
+    return type(attributes.get("mglo")).__name__ == "InvalidObject"
+
+def get_creation_site(depth: int) -> List[str]:
+    '''The innermost `depth` frames calling into this module, as "file:line in function".'''
+    frame = sys._getframe(1)
+    while frame is not None and frame.f_code.co_filename == __file__:
+        frame = frame.f_back
+    result = []
+    while frame is not None and len(result) < depth:
+        code = frame.f_code
+        result.append(f"{os.path.basename(code.co_filename)}:{frame.f_lineno} in {code.co_name}")
+        frame = frame.f_back
+    return result
+
+
+class GLResourceRegistry:
+    '''Records the GL objects allocated by manimgl_3d: kind, size, owner and (opt-in) the call stack which created them.
+
+    Only a weak reference to each object is kept. An entry is dropped once its object is found released, or
+    when the object is collected after release(). An object collected without being released, which moderngl
+    never frees by itself, stays recorded as live, which is exactly a leak.
+    Creation stacks are only captured with `capture_stacks`, i.e. with MANIMGL_3D_GL_STACKS=1.'''
+
+    def __init__(self, stack_depth: int = 6, prune_interval: int = 1024):
+        self.stack_depth = stack_depth
+        self.prune_interval = prune_interval # released objects still referenced are pruned every that many inserts
+        self.enabled = True
+        self.capture_stacks = os.environ.get("MANIMGL_3D_GL_STACKS", "0") != "0"
+        self.entries: dict[int, dict] = {}  # key -> entry
+        self.next_key = 0 # not id(obj), which a new object may reuse while a leaked one is still recorded
+        self.stats = {
+            "tracked": 0,   # objects recorded so far
+            "released": 0,  # objects found released
+            "leaked": 0,    # objects collected without being released
+        }
+
+    def track(self, obj, owner: object = None, nbytes: Optional[int] = None):
+        '''Records `obj` (returned unchanged). `nbytes` overrides the size read from the object, e.g. to count mipmaps.'''
+        if not self.enabled:
+            return obj
+        key = self.next_key
+        self.next_key += 1
+        self.entries[key] = {
+            "ref": weakref.ref(obj, lambda _, key=key: self.on_collected(key)),
+            # NOTE: the attributes of the wrapper (mglo, ctx, ...) outlive it until on_collected, which tells
+            # from them whether it was released; they don't reference the wrapper itself
+            "attributes": vars(obj),
+            "kind": get_gl_object_kind(obj),
+            "nbytes": get_gl_object_nbytes(obj) if nbytes is None else nbytes,
+            "fixed_nbytes": nbytes is not None,
+            "owner": "" if owner is None else type(owner).__name__,
+            "owner_id": None if owner is None else id(owner),
+            "stack": get_creation_site(self.stack_depth) if self.capture_stacks else [],
+        }
+        self.stats["tracked"] += 1
+        if self.stats["tracked"] % self.prune_interval == 0:
+            self.prune()
+        return obj
+
+    def on_collected(self, key: int) -> None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return
+        if is_gl_object_released(entry["attributes"]):
+            del self.entries[key]
+            self.stats["released"] += 1
+        else:
+            self.stats["leaked"] += 1
+
+    def prune(self) -> None:
+        for key in [key for key, entry in list(self.entries.items()) if is_gl_object_released(entry["attributes"])]:
+            if self.entries.pop(key, None) is not None: # unless collected meanwhile
+                self.stats["released"] += 1
+
+    def get_live_resources(self, ctx: Optional[mgl.Context] = None, owner: object = None) -> List[dict]:
+        '''Entries of the objects not released yet, optionally only those of a context or an owner.
+        "object" is None for an object collected without being released.'''
+        self.prune()
+        result = []
+        for entry in list(self.entries.values()):
+            if (ctx is not None and entry["attributes"].get("ctx") is not ctx) or (owner is not None and entry["owner_id"] != id(owner)):
+                continue
+            obj = entry["ref"]()
+            if obj is not None and not entry["fixed_nbytes"]:
+                entry["nbytes"] = get_gl_object_nbytes(obj) # e.g. orphaned buffers
+            result.append({
+                "kind": entry["kind"],
+                "nbytes": entry["nbytes"],
+                "owner": entry["owner"],
+                "site": entry["stack"][0] if entry["stack"] else "",
+                "stack": entry["stack"],
+                "object": obj,
+            })
+        return result
+
+    def get_report(self, ctx: Optional[mgl.Context] = None) -> dict:
+        '''Count and bytes of the live objects, in total and by kind, owner and creation site.'''
+        report = {"count": 0, "nbytes": 0, "by_kind": {}, "by_owner": {}, "by_site": {}}
+        groups = {key: defaultdict(lambda: {"count": 0, "nbytes": 0}) for key in ("by_kind", "by_owner", "by_site")}
+        for resource in self.get_live_resources(ctx):
+            report["count"] += 1
+            report["nbytes"] += resource["nbytes"]
+            for key, value in (("by_kind", resource["kind"]), ("by_owner", resource["owner"]), ("by_site", resource["site"])):
+                groups[key][value]["count"] += 1
+                groups[key][value]["nbytes"] += resource["nbytes"]
+        for key, group in groups.items():
+            report[key] = dict(sorted(group.items(), key=lambda item: -item[1]["nbytes"]))
+        return report
+
+    def format_report(self, ctx: Optional[mgl.Context] = None, top: int = 10) -> str:
+        report = self.get_report(ctx)
+        lines = [f"{report['count']} live GL objects, {report['nbytes'] / 2**20:.1f} MB"]
+        for key, title in (("by_kind", "kind"), ("by_owner", "owner"), ("by_site", "creation site")):
+            lines.append(f"by {title}:")
+            for name, value in list(report[key].items())[:top]:
+                lines.append(f"    {name or '-':<48} {value['count']:>6} {value['nbytes'] / 2**20:>10.2f} MB")
+        return "\n".join(lines)
+
+    def check_leaks(self, ctx: Optional[mgl.Context] = None, owner: object = None) -> List[dict]:
+        '''Logs the objects still alive, meant to be called once everything should have been released.'''
+        leaks = self.get_live_resources(ctx, owner)
+        if leaks:
+            sites = defaultdict(list)
+            for resource in leaks:
+                sites[(resource["kind"], resource["owner"], resource["site"])].append(resource["nbytes"])
+            log.warning(f"{len(leaks)} GL objects ({sum(r['nbytes'] for r in leaks) / 2**20:.2f} MB) were not released:")
+            for (kind, owner_name, site), sizes in sites.items():
+                log.warning(f"    {len(sizes)} x {kind} ({sum(sizes)} bytes) owned by {owner_name or '-'}, created at {site}")
+        return leaks
+
+
+gl_resources = GLResourceRegistry()
+
+def track_gl(obj, owner: object = None, nbytes: Optional[int] = None):
+    '''Records a GL object in the global registry (see GLResourceRegistry.track).'''
+    return gl_resources.track(obj, owner, nbytes)
@@ -6,9 +6,11 @@ from OpenGL.GL import *
 import moderngl as mgl
 from functools import cache
 from PIL import Image
-from typing import Union, Sequence
+from typing import Union, Sequence, Tuple
 
 from manimgl_3d.shader_compatibility import get_shader_code_from_file_extended
+from manimgl_3d.utils.image_utils import load_image_mips, expand_to_rgba
+from manimgl_3d.utils.gl_resources import track_gl
 
 
 def _my_texture_configuration(texture: mgl.Texture) -> None: # abondoned
@@ -53,10 +55,14 @@ def gl_render_quad():
 # implemented with moderngl
 
 # NOTE: Due to the nature of modergl, whenever a VertexArray within a different context/program is needed,
-# a new instance of VertexArray needs to be created. There is currently no way to ensure the old VAO is
-# release properly.
-@cache
+# a new instance of VertexArray needs to be created. They are kept here, keyed by (context, program), until
+# `release_quad_vaos` is called for the context.
+_quad_vaos: dict = {}
+
 def get_quad_vao(context: mgl.Context, program: mgl.Program) -> mgl.VertexArray:
+    key = (context, program)
+    if key in _quad_vaos:
+        return _quad_vaos[key][0]
     # data
     coords = np.array([
             -1.0,  1.0, 0.0, 0.0, 1.0,
@@ -64,26 +70,33 @@ def get_quad_vao(context: mgl.Context, program: mgl.Program) -> mgl.VertexArray:
              1.0,  1.0, 0.0, 1.0, 1.0,
              1.0, -1.0, 0.0, 1.0, 0.0
         ], dtype = 'f4') # 4 bytes (32 bits) per float
-    vbo = context.buffer(coords.tobytes())
+    vbo = track_gl(context.buffer(coords.tobytes()))
 
     # NOTE: Buffer Format only describes the layout of data input from the app side,
     # while Internal Format describes the data format stored internally.
-    vao = context.vertex_array(
+    vao = track_gl(context.vertex_array(
             program = program,
             content = [(vbo, "3f4 2f4 /v", 'point', 'tex_coords')],
-        )
+        ))
+    _quad_vaos[key] = (vao, vbo)
     return vao
 
+def release_quad_vaos(context: mgl.Context) -> None:
+    '''Releases the quad VAOs (and their VBOs) of a context, e.g. before its programs are released.'''
+    for key in [key for key in _quad_vaos if key[0] == context]:
+        for obj in _quad_vaos.pop(key):
+            obj.release()
+
 def render_quad(context: mgl.Context, program: mgl.Program):
     vao = get_quad_vao(context, program)
     vao.render(mgl.TRIANGLE_STRIP)
 
 @cache
 def get_quad_prog(ctx: mgl.Context):
-    return ctx.program(
+    return track_gl(ctx.program(
         vertex_shader=get_shader_code_from_file_extended('pbr/quad_vert.glsl'),
         fragment_shader=get_shader_code_from_file_extended('pbr/quad_frag.glsl')
-    )
+    ))
 
 def render_texture_on_quad(ctx: mgl.Context, texture: mgl.Texture, frambuffer: mgl.Framebuffer):
     program = get_quad_prog(ctx)
@@ -140,24 +153,93 @@ def blit_fbo(context: mgl.Context, src_fbo: mgl.Framebuffer, dst_fbo: mgl.Frameb
     context.copy_framebuffer(dst_fbo, src_fbo)
 
 
-@cache
-def image_path_to_texture(context: mgl.Context, path: str) -> mgl.Texture:
-    im = Image.open(path).convert("RGBA")
-    return context.texture(
-        size=im.size,
-        components=len(im.getbands()), # 4
-        data=im.tobytes()
+def solid_value_to_rgba(value: Union[float, np.ndarray, Sequence[float]], *, dtype = 'f4') -> np.ndarray:
+    '''Expand a constant property value into one RGBA texel, keeping what sampling a texture with fewer components gives.'''
+    if isinstance(value, (float, int)):
+        value = (value,)
+    rgba = np.array([0., 0., 0., 1.], dtype = dtype)
+    rgba[:len(value)] = value
+    return rgba
+
+def image_path_to_texture(context: mgl.Context, path: str, *, mipmaps = True, anisotropy = 1.0) -> mgl.Texture:
+    levels = load_image_mips(path)
+    texture = context.texture(
+        size=levels[0].shape[1::-1],
+        components=4,
+        data=expand_to_rgba(levels[0]).tobytes()
     )
+    track_gl(texture, nbytes=sum(level.shape[0] * level.shape[1] * 4 for level in (levels if mipmaps else levels[:1])))
+    if mipmaps:
+        texture.build_mipmaps() # allocates the levels, then overwritten with the (cached) box filtered ones
+        for i, level in enumerate(levels[1:], start=1):
+            texture.write(expand_to_rgba(level).tobytes(), level=i)
+        texture.anisotropy = anisotropy
+    return texture
 
-# TODO: can't cache because np.ndarray is not hashable
-def get_solid_texture(context: mgl.Context, value: Union[float, np.ndarray, Sequence[float]], *, dtype = 'f4') -> mgl.Context:
-    # NOTE: Only support float value
-    if isinstance(value, float):
+# implemented with PyOpenGL
+def write_texture_array_level(context: mgl.Context, texture_array: mgl.TextureArray, level: int, data: np.ndarray) -> None:
+    '''Upload all the layers of one mip level, `data.shape = (layers, height, width, 4)` (uint8).
+    ModernGL can only write the base level of a texture array.'''
+    layers, height, width, _ = data.shape
+    glActiveTexture(GL_TEXTURE0 + context.default_texture_unit)
+    glBindTexture(GL_TEXTURE_2D_ARRAY, texture_array.glo)
+    glPixelStorei(GL_UNPACK_ALIGNMENT, 1)
+    glTexSubImage3D(
+        GL_TEXTURE_2D_ARRAY, level,
+        0, 0, 0, width, height, layers,
+        GL_RGBA, GL_UNSIGNED_BYTE, np.ascontiguousarray(data)
+    )
+    glBindTexture(GL_TEXTURE_2D_ARRAY, 0)
+
+# 1x1 textures of constant values, shared within a context (see get_solid_texture and get_solid_texture_array)
+_solid_textures: dict[tuple, Union[mgl.Texture, mgl.TextureArray]] = {}     # (context, kind, dtype, quantized values) -> texture
+_solid_texture_stats: dict[mgl.Context, dict] = {}
+
+SOLID_VALUE_STEPS = 2**16 # constant values are rounded to 1/SOLID_VALUE_STEPS, so that nearly equal ones share a texture
+
+def quantize_solid_value(value: Union[float, np.ndarray, Sequence[float]]) -> Tuple[float, ...]:
+    '''The key of a constant property value, its components rounded to 1/SOLID_VALUE_STEPS.'''
+    if isinstance(value, (float, int)):
         value = (value,)
-    data = np.array([*value], dtype = dtype)
-    return context.texture(
+    return tuple((np.round(np.array(value, dtype=float).flatten() * SOLID_VALUE_STEPS) / SOLID_VALUE_STEPS).tolist())
+
+def _get_pooled_solid_texture(context: mgl.Context, key: tuple, create) -> Union[mgl.Texture, mgl.TextureArray]:
+    stats = _solid_texture_stats.setdefault(context, {"requests": 0, "allocations": 0})
+    stats["requests"] += 1
+    key = (context, *key)
+    if key not in _solid_textures:
+        _solid_textures[key] = track_gl(create())
+        stats["allocations"] += 1
+    return _solid_textures[key]
+
+def get_solid_texture(context: mgl.Context, value: Union[float, np.ndarray, Sequence[float]], *, dtype = 'f4') -> mgl.Texture:
+    '''A 1x1 texture of a constant value, shared by the equal values (once quantized) of all the materials of a
+    context. The textures belong to the pool, until release_solid_textures.'''
+    value = quantize_solid_value(value)
+    return _get_pooled_solid_texture(context, ("texture", dtype, value), lambda: context.texture(
         size = (1,1),
         components = len(value),
-        data = data.tobytes(),
+        data = np.array(value, dtype = dtype).tobytes(),
         dtype = dtype
-    )
\ No newline at end of file
+    ))
+
+def get_solid_texture_array(context: mgl.Context, values: Sequence[Union[float, np.ndarray, Sequence[float]]], *, dtype = 'f4') -> mgl.TextureArray:
+    '''A 1x1 RGBA texture array with one layer per constant value (see solid_value_to_rgba), pooled like get_solid_texture:
+    the materials whose constant properties are equal (once quantized) share it.'''
+    values = tuple(quantize_solid_value(value) for value in values)
+    return _get_pooled_solid_texture(context, ("array", dtype, values), lambda: context.texture_array(
+        size = (1, 1, len(values)),
+        components = 4,
+        data = np.stack([solid_value_to_rgba(value, dtype=dtype) for value in values]).tobytes(),
+        dtype = dtype
+    ))
+
+def get_solid_texture_stats(context: mgl.Context) -> dict:
+    '''Requests and allocations of the pooled constant textures of a context, and the textures it holds.'''
+    stats = _solid_texture_stats.get(context, {"requests": 0, "allocations": 0})
+    return {**stats, "textures": sum(1 for key in _solid_textures if key[0] == context)}
+
+def release_solid_textures(context: mgl.Context) -> None:
+    for key in [key for key in _solid_textures if key[0] == context]:
+        _solid_textures.pop(key).release()
+    _solid_texture_stats.pop(context, None)
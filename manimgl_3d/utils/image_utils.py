@@ -0,0 +1,64 @@
+import numpy as np
+from PIL import Image
+from typing import List
+
+from manimgl_3d.utils.cache_utils import get_file_hash, load_cached_arrays
+
+# NOTE: bump it whenever the layout or the filtering of the cached levels changes
+MIP_CACHE_VERSION = "source-channels-box-2"
+
+
+def get_mip_sizes(width: int, height: int) -> List[tuple]:
+    '''Sizes of a full mip chain, halving down to 1x1 the same way as glGenerateMipmap.'''
+    sizes = [(width, height)]
+    while sizes[-1] != (1, 1):
+        w, h = sizes[-1]
+        sizes.append((max(1, w // 2), max(1, h // 2)))
+    return sizes
+
+def get_level_mode(image: Image.Image) -> str:
+    '''The mode of the mip levels of an image: its own channels, so that a grayscale map (roughness, metallic, AO)
+    takes one byte per texel. Expanding them with `expand_to_rgba` gives what converting to RGBA would.'''
+    if image.mode in ("L", "LA", "RGB", "RGBA"):
+        return image.mode
+    if image.mode == "1":
+        return "L"
+    if image.mode in ("CMYK", "YCbCr", "LAB", "HSV") or (image.mode == "P" and "transparency" not in image.info):
+        return "RGB"
+    return "RGBA"
+
+def build_mip_chain(image: Image.Image) -> List[np.ndarray]:
+    '''Returns the levels (shape = (height, width, channels), uint8) of the full mip chain of an image, with
+    1 to 4 channels (see `get_level_mode`). Each level is box filtered from the previous one.'''
+    image = image.convert(get_level_mode(image))
+    levels = [np.asarray(image).reshape(image.height, image.width, -1)]
+    for size in get_mip_sizes(*image.size)[1:]:
+        image = image.resize(size, Image.BOX)
+        levels.append(np.asarray(image).reshape(image.height, image.width, -1))
+    return levels
+
+def expand_to_rgba(level: np.ndarray) -> np.ndarray:
+    '''The RGBA texels of a mip level, as PIL converts L, LA and RGB images: gray replicated, opaque if no alpha.'''
+    channels = level.shape[2]
+    if channels == 4:
+        return level
+    rgba = np.empty((*level.shape[:2], 4), dtype=level.dtype)
+    rgba[..., :3] = level if channels == 3 else level[..., :1]
+    rgba[..., 3] = level[..., 1] if channels == 2 else 255
+    return rgba
+
+def load_image_mips(path: str, *, use_cache: bool = True) -> List[np.ndarray]:
+    '''Decodes an image into its mip chain (see `build_mip_chain`).
+
+    The levels are cached on disk as .npy files, keyed by the hash of the file content, and memory-mapped
+    when found, so the same image is only decoded once across renders (until evicted, see
+    cache_utils.load_cached_arrays). The returned arrays are read-only.'''
+    if not use_cache:
+        with Image.open(path) as im:
+            return build_mip_chain(im)
+
+    def compute():
+        with Image.open(path) as im:
+            return {f"level_{i}": level for i, level in enumerate(build_mip_chain(im))}
+    arrays = load_cached_arrays("textures", get_file_hash(path, MIP_CACHE_VERSION), compute)
+    return [arrays[f"level_{i}"] for i in range(len(arrays))]
@@ -1,51 +1,129 @@
 import numpy as np
-
-def compute_tangents(vertices: np.ndarray, tex_coords: np.ndarray, normals: np.ndarray, face_indices: np.ndarray) -> np.ndarray:
-    '''Compute the tangent vectors (per vertex) of a 3D model based on its texture coordinates.
-    Calculating the tangent vectors is not as straightforward as the normal vector.
-    See: https://learnopengl.com/Advanced-Lighting/Normal-Mapping'''
+import trimesh
+from typing import Dict, Tuple
+
+from manimgl_3d.utils.cache_utils import get_file_hash, load_cached_arrays
+
+# NOTE: bump it whenever the content of the cached meshes changes
+MESH_CACHE_VERSION = "mesh-3"
+
+# number of faces processed at once by compute_tangent_frames, bounding the temporary arrays to about 100 MB
+TANGENT_CHUNK_SIZE = 1 << 18
+
+def compute_tangent_frames(
+        vertices: np.ndarray,
+        tex_coords: np.ndarray,
+        normals: np.ndarray,
+        face_indices: np.ndarray,
+        *,
+        chunk_size: int = TANGENT_CHUNK_SIZE,
+        eps: float = 1e-12
+    ) -> Tuple[np.ndarray, np.ndarray]:
+    '''Compute the tangent vectors (per vertex, perpendicular to the normals but not normalized) of a 3D model
+    based on its texture coordinates, and the handedness (+1 or -1) of the bitangents, so that
+    bitangent = handedness * cross(normal, tangent), as pbr/frag.glsl builds it. The tangents follow the
+    first texture coordinate and the bitangents the second one, the handedness is -1 where the uvs are mirrored.
+    See: https://learnopengl.com/Advanced-Lighting/Normal-Mapping
+
+    Faces whose texture coordinates are degenerate (zero uv area) contribute nothing, and vertices left
+    without any tangent get an arbitrary one perpendicular to their normal. The faces are processed in
+    chunks of `chunk_size`, so the memory used doesn't grow with the number of faces.'''
 
     assert vertices.shape[1] == 3 and tex_coords.shape[1] == 2 and face_indices.shape[1] == 3
 
-    # let n = number of faces, v = number of vertices
-    
-    index1, index2, index3 = face_indices.transpose()
-    vertex1, vertex2, vertex3 = vertices[index1], vertices[index2], vertices[index3]
-    tex1, tex2, tex3 = tex_coords[index1], tex_coords[index2], tex_coords[index3]
-    
-    vector1_xyz = vertex2 - vertex1     # shape = (n, 3)
-    vector2_xyz = vertex3 - vertex1     # shape = (n, 3)
-
-    vector1_uv = tex2 - tex1    # shape = (n, 2)
-    vector2_uv = tex3 - tex1    # shape = (n, 2)
-
-    mat_xyz = np.stack((vector1_xyz, vector2_xyz), axis=-1)   # shape = (n, 3, 2)
-    mat_uv = np.stack((vector1_uv, vector2_uv), axis=-1)      # shape = (n, 2, 2)
+    n_vertices = len(vertices)
+    tangents = np.zeros((n_vertices, 3))
+    bitangents = np.zeros((n_vertices, 3))
+
+    for start in range(0, len(face_indices), chunk_size):
+        faces = np.asarray(face_indices[start:start + chunk_size])
+        index1, index2, index3 = faces.T
+        vertex1 = vertices[index1]
+        tex1 = tex_coords[index1]
+
+        vector1_xyz = vertices[index2] - vertex1    # shape = (n, 3)
+        vector2_xyz = vertices[index3] - vertex1    # shape = (n, 3)
+        du1, dv1 = (tex_coords[index2] - tex1).T    # shape = (n,)
+        du2, dv2 = (tex_coords[index3] - tex1).T
+
+        # [tangent, bitangent] = [vector1_xyz, vector2_xyz] @ inverse([[du1, du2], [dv1, dv2]])
+        det = du1 * dv2 - du2 * dv1
+        valid = np.abs(det) > eps
+        inv_det = np.divide(1.0, det, out=np.zeros_like(det), where=valid)[:, None]
+        tangent_per_face = (vector1_xyz * dv2[:, None] - vector2_xyz * dv1[:, None]) * inv_det
+        bitangent_per_face = (vector2_xyz * du1[:, None] - vector1_xyz * du2[:, None]) * inv_det
+
+        # Accumulate (per face) to the face vertices
+        corner_indices = faces.T.ravel()    # the 3 corners of every face
+        for per_face, per_vertex in ((tangent_per_face, tangents), (bitangent_per_face, bitangents)):
+            weights = np.tile(per_face, (3, 1))
+            for axis in range(3):
+                per_vertex[:, axis] += np.bincount(corner_indices, weights=weights[:, axis], minlength=n_vertices)
 
-    mat_uv_inv = np.linalg.inv(mat_uv)
-    uv = mat_xyz @ mat_uv_inv
+    # Ensure the tangent vectors is perpendicular to the normal vectors
+    tangents -= np.sum(tangents * normals, axis=1, keepdims=True) * normals
 
-    tangent_per_face = uv[:, :, 0]   # the matrix consists of [tangent_xyz, bitangent_xyz]  (as column vectors)
-    
-    # Accumulate tangent (per face) to the face vertices
-    tangent_per_vertex = np.zeros_like(vertices)            # shape = (v, 3)
-    for index in (index1, index2, index3):
-        np.add.at(tangent_per_vertex, index, tangent_per_face)
+    # Vertices only touching degenerate faces: any direction perpendicular to the normal
+    missing = np.linalg.norm(tangents, axis=1) <= eps
+    if missing.any():
+        missing_normals = normals[missing]
+        axis = np.where(np.abs(missing_normals[:, :1]) < 0.9, [[1., 0., 0.]], [[0., 1., 0.]])
+        tangents[missing] = np.cross(axis, missing_normals)
 
-    # Ensure the tangent vectors is perpendicular to the normal vectors
-    tangent_per_vertex -= np.sum(tangent_per_vertex * normals, axis=1, keepdims=True) * normals
+    handedness = np.where(np.sum(np.cross(normals, tangents) * bitangents, axis=1) < 0.0, -1.0, 1.0)
+    return tangents, handedness
 
-    return tangent_per_vertex
+def compute_tangents(vertices: np.ndarray, tex_coords: np.ndarray, normals: np.ndarray, face_indices: np.ndarray) -> np.ndarray:
+    '''Compute the tangent vectors (per vertex) of a 3D model based on its texture coordinates, see `compute_tangent_frames`.'''
+    return compute_tangent_frames(vertices, tex_coords, normals, face_indices)[0]
 
 def np_normalize(vectors: np.ndarray):
     norms = np.linalg.norm(vectors, axis=1, keepdims=True)
     norms[norms == 0] = 1
     return vectors / norms
 
+def get_mesh_arrays(model: trimesh.Trimesh) -> Dict[str, np.ndarray]:
+    '''Extracts the per vertex data (and the faces) of a mesh, computing the tangents and their handedness.'''
+    vertices = model.vertices
+    face_indices = model.faces
+    normals = model.vertex_normals
+
+    if hasattr(model.visual, 'uv') and model.visual.uv is not None:
+        tex_coords = model.visual.uv
+    else:
+        tex_coords = np.zeros((len(model.vertices), 2))
+
+    tangents, handedness = compute_tangent_frames(
+        np.asarray(vertices, dtype=float), np.asarray(tex_coords, dtype=float), np.asarray(normals, dtype=float), face_indices
+    )
+    return {
+        "vertices": np.asarray(vertices, dtype=float),
+        "faces": np.asarray(face_indices, dtype=np.int64),
+        "normals": np.asarray(normals, dtype=float),
+        "tangents": tangents,
+        "handedness": handedness,
+        "tex_coords": np.asarray(tex_coords, dtype=float),
+    }
+
+def load_mesh_arrays(model_path: str, *, process: bool = True, use_cache: bool = True) -> Dict[str, np.ndarray]:
+    '''Loads a model file (scenes are flattened into one mesh), see `get_mesh_arrays`.
+
+    The arrays are cached on disk, keyed by the hash of the file content and the import options, and
+    memory-mapped when found, so a model is only parsed once across renders (until evicted, see
+    cache_utils.load_cached_arrays). The returned arrays are read-only.'''
+    def compute():
+        model = trimesh.load_mesh(model_path, process=process)
+        if isinstance(model, trimesh.Scene):
+            model = trimesh.util.concatenate(model.dump())
+        return get_mesh_arrays(model)
+
+    if not use_cache:
+        return compute()
+    return load_cached_arrays("meshes", get_file_hash(model_path, MESH_CACHE_VERSION, f"process={process}"), compute)
+
 
 # Test Script
 if __name__ == "__main__":
-    import trimesh
 
     # FILEPATH = "./assets/coffee-cup/obj/coffee_cup_obj.obj"
     FILEPATH = "./assets/cone/Cone.obj"
@@ -0,0 +1,78 @@
+'''Compiled shader programs shared within a context, and their compilation up front.
+
+moderngl can't create a program from a binary (glProgramBinary), so the binaries themselves are left to the
+disk cache of the driver (see `enable_driver_shader_cache` in directories_utils, opt-in), which is keyed by the
+sources and the driver. What's done here is compiling each distinct source once, letting the driver use all
+its compiler threads where it supports GL_KHR_parallel_shader_compile. The cameras compile the programs of a
+scene before its first frame (see PBRCamera.warm_up_programs).'''
+
+import hashlib
+import moderngl as mgl
+from OpenGL.GL.KHR.parallel_shader_compile import glMaxShaderCompilerThreadsKHR
+from OpenGL.GL.ARB.parallel_shader_compile import glMaxShaderCompilerThreadsARB
+from typing import Dict, Optional
+
+from manimgl_3d.utils.gl_resources import track_gl
+
+SHADER_STAGES = ("vertex_shader", "geometry_shader", "fragment_shader")
+
+
+def get_driver_string(ctx: mgl.Context) -> str:
+    return " | ".join(ctx.info[key] for key in ("GL_VENDOR", "GL_RENDERER", "GL_VERSION"))
+
+
+def enable_parallel_shader_compile(ctx: mgl.Context) -> bool:
+    '''Lets the driver compile with as many threads as it likes (GL_KHR_parallel_shader_compile, or the ARB one),
+    returns whether it supports it.'''
+    for extension, function in (
+        ("GL_KHR_parallel_shader_compile", glMaxShaderCompilerThreadsKHR),
+        ("GL_ARB_parallel_shader_compile", glMaxShaderCompilerThreadsARB),
+    ):
+        # NOTE: PyOpenGL only resolves it on the platform of the context (e.g. PYOPENGL_PLATFORM=egl with an EGL context)
+        if extension in ctx.extensions and bool(function):
+            function(0xFFFFFFFF)
+            return True
+    return False
+
+
+class ShaderProgramCache:
+    '''The programs of a context, one per distinct source.
+
+    The key of a program hashes the driver string and its preprocessed sources (as returned by
+    get_shader_code_from_file_extended). Nothing is written to disk: the driver caches the binaries, if enabled.'''
+
+    def __init__(self, ctx: mgl.Context):
+        self.ctx = ctx
+        self.driver = get_driver_string(ctx)
+        self.programs: Dict[str, mgl.Program] = {}  # key -> program
+        self.parallel_compile = enable_parallel_shader_compile(ctx)
+        self.stats = {
+            "compiled": 0,  # programs compiled
+            "reused": 0,    # requests served by an already compiled program
+        }
+
+    def get_key(self, code: Dict[str, Optional[str]]) -> str:
+        digest = hashlib.sha1(self.driver.encode())
+        for stage in SHADER_STAGES:
+            digest.update(f"\0{stage}\0".encode())
+            digest.update((code.get(stage) or "").encode())
+        return digest.hexdigest()
+
+    def get(self, **code: Optional[str]) -> mgl.Program:
+        '''The program of these sources (vertex_shader, geometry_shader, fragment_shader), compiled on first use.'''
+        key = self.get_key(code)
+        if key in self.programs:
+            self.stats["reused"] += 1
+            return self.programs[key]
+        return self.compile(key, code)
+
+    def compile(self, key: str, code: Dict[str, Optional[str]]) -> mgl.Program:
+        program = track_gl(self.ctx.program(**{stage: source for stage, source in code.items() if source is not None}), self)
+        self.programs[key] = program
+        self.stats["compiled"] += 1
+        return program
+
+    def release(self) -> None:
+        for program in self.programs.values():
+            program.release()
+        self.programs = {}
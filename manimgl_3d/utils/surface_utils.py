@@ -0,0 +1,66 @@
+import numpy as np
+from functools import lru_cache
+from typing import Callable, Tuple
+
+# NOTE: number of distinct surface parameters whose grids are kept, the least recently used ones are dropped
+UV_GRID_CACHE_SIZE = 64
+TRIANGLE_INDICES_CACHE_SIZE = 128
+
+@lru_cache(maxsize=UV_GRID_CACHE_SIZE)
+def get_uv_grid(
+        resolution: Tuple[int, int],
+        u_range: Tuple[float, float],
+        v_range: Tuple[float, float],
+        tex_coords_scale: Tuple[float, float]
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    '''Sample the parameter space of a surface, returning the flattened u, v grids and the texture coordinates.
+    The samples are ordered the same way as manimlib.Surface (u-major). The arrays are shared between
+    all the surfaces with the same parameters, so they are marked read-only: copy them before editing.'''
+
+    nu, nv = resolution
+    su, sv = tex_coords_scale
+
+    u_grid, v_grid = np.meshgrid(np.linspace(*u_range, nu), np.linspace(*v_range, nv), indexing='ij')
+    tex_u, tex_v = np.meshgrid(np.linspace(0, su, nu), np.linspace(sv, 0, nv), indexing='ij')  # Reverse y-direction
+
+    u_values, v_values = u_grid.ravel(), v_grid.ravel()
+    tex_coords = np.stack((tex_u.ravel(), tex_v.ravel()), axis=-1)
+
+    for arr in (u_values, v_values, tex_coords):
+        arr.setflags(write=False)
+    return u_values, v_values, tex_coords
+
+def evaluate_uv_func(uv_func: Callable, u_values: np.ndarray, v_values: np.ndarray, dim: int = 3) -> np.ndarray:
+    '''Call a vectorized uv_func once on whole arrays of u, v values.
+    Both `np.array([x, y, z])` (shape = (dim, n)) and (n, dim) results are accepted.'''
+
+    n = len(u_values)
+    points = np.asarray(uv_func(u_values, v_values), dtype=float)
+    if points.shape == (dim, n):
+        points = points.T
+    if points.shape != (n, dim):
+        raise ValueError(f'uv_func returned an array of shape {points.shape} for {n} samples, expected ({n}, {dim}).')
+    return points
+
+@lru_cache(maxsize=TRIANGLE_INDICES_CACHE_SIZE)
+def get_grid_triangle_indices(resolution: Tuple[int, int], stride: int = 1) -> np.ndarray:
+    '''Triangle indices of a (nu, nv) grid of samples, as manimlib.Surface.compute_triangle_indices, keeping only
+    every `stride`-th row and column (and the last ones, so the coarser grid spans the same range).
+    The array is shared and read-only.'''
+
+    nu, nv = resolution
+    rows = np.unique(np.append(np.arange(0, nu, stride), nu - 1))
+    cols = np.unique(np.append(np.arange(0, nv, stride), nv - 1))
+    if len(rows) < 2 or len(cols) < 2:
+        return np.zeros(0, dtype=int)
+    index_grid = np.arange(nu * nv).reshape((nu, nv))[np.ix_(rows, cols)]
+
+    indices = np.zeros(6 * (len(rows) - 1) * (len(cols) - 1), dtype=int)
+    indices[0::6] = index_grid[:-1, :-1].flatten()  # Top left
+    indices[1::6] = index_grid[+1:, :-1].flatten()  # Bottom left
+    indices[2::6] = index_grid[:-1, +1:].flatten()  # Top right
+    indices[3::6] = index_grid[:-1, +1:].flatten()  # Top right
+    indices[4::6] = index_grid[+1:, :-1].flatten()  # Bottom left
+    indices[5::6] = index_grid[+1:, +1:].flatten()  # Bottom right
+    indices.setflags(write=False)
+    return indices
@@ -0,0 +1,87 @@
+'''Tangent frames of meshes with mirrored texture coordinates (see model_utils.compute_tangent_frames).
+
+    python -m pytest tests
+'''
+
+import os
+os.environ.setdefault("PYGLET_HEADLESS", "1") # manimlib imports pyglet, which needs no display then
+
+import numpy as np
+import trimesh
+
+from manimgl_3d.utils.model_utils import compute_tangent_frames, get_mesh_arrays
+from manimgl_3d.pbr.surface_pbr import ModelPBR
+
+
+def make_mirrored_quads():
+    '''Two unit quads in the xy plane facing +z, textured the same way, the right one mirrored along u.'''
+    corners = np.array([[0., 0., 0.], [1., 0., 0.], [1., 1., 0.], [0., 1., 0.]])
+    vertices = np.vstack([corners, corners + [2., 0., 0.]])
+    tex_coords = np.vstack([corners[:, :2], corners[:, :2] * [-1., 1.]])
+    faces = np.array([[0, 1, 2], [0, 2, 3], [4, 5, 6], [4, 6, 7]])
+    normals = np.tile([0., 0., 1.], (len(vertices), 1))
+    return vertices, tex_coords, normals, faces
+
+def test_handedness_of_mirrored_uvs():
+    vertices, tex_coords, normals, faces = make_mirrored_quads()
+    tangents, handedness = compute_tangent_frames(vertices, tex_coords, normals, faces)
+    np.testing.assert_array_equal(handedness, [1.] * 4 + [-1.] * 4)
+
+    # tangents along +u, bitangents = handedness * cross(normal, tangent) along +v (world +y on both quads)
+    unit_tangents = tangents / np.linalg.norm(tangents, axis=1, keepdims=True)
+    np.testing.assert_allclose(unit_tangents[:4], [[1., 0., 0.]] * 4)
+    np.testing.assert_allclose(unit_tangents[4:], [[-1., 0., 0.]] * 4)
+    bitangents = handedness[:, None] * np.cross(normals, unit_tangents)
+    np.testing.assert_allclose(bitangents, [[0., 1., 0.]] * 8)
+
+def test_chunks_match():
+    vertices, tex_coords, normals, faces = make_mirrored_quads()
+    whole = compute_tangent_frames(vertices, tex_coords, normals, faces)
+    chunked = compute_tangent_frames(vertices, tex_coords, normals, faces, chunk_size=1)
+    for a, b in zip(whole, chunked):
+        np.testing.assert_allclose(a, b)
+
+def test_degenerate_uvs():
+    vertices, _, normals, faces = make_mirrored_quads()
+    tangents, handedness = compute_tangent_frames(vertices, np.zeros((len(vertices), 2)), normals, faces)
+    assert np.isfinite(tangents).all()
+    np.testing.assert_allclose(np.sum(tangents * normals, axis=1), 0.)
+    assert (np.linalg.norm(tangents, axis=1) > 0).all()
+    assert set(handedness) <= {-1., 1.}
+
+def make_mirrored_mesh() -> trimesh.Trimesh:
+    vertices, tex_coords, _, faces = make_mirrored_quads()
+    return trimesh.Trimesh(vertices, faces, visual=trimesh.visual.TextureVisuals(uv=tex_coords), process=False)
+
+def test_mesh_arrays_keep_handedness():
+    arrays = get_mesh_arrays(make_mirrored_mesh())
+    np.testing.assert_array_equal(arrays["handedness"], [1.] * 4 + [-1.] * 4)
+
+def test_model_shader_data(tmp_path):
+    path = str(tmp_path / "quads.obj")
+    make_mirrored_mesh().export(path)
+    model = ModelPBR(path, use_mesh_cache=False)
+    shader_data = model.get_shader_data()
+    handedness = model.get_handedness()[:, 0]
+    assert sorted(set(handedness)) == [-1., 1.]
+    np.testing.assert_array_equal(shader_data["tangent"][:, 3], handedness)
+
+    # the shaders sample at 1 - uv: the tangent follows 1 - u, the bitangent 1 - v (world -y on both quads)
+    tangent = shader_data["tangent"][:, :3].astype(float)
+    tex_u = shader_data["tex_coords"][:, 0]
+    points = shader_data["point"]
+    for quad in (points[:, 0] < 1.5, points[:, 0] > 1.5):
+        direction = np.sign(np.polyfit(points[quad, 0], tex_u[quad], 1)[0]) # of 1 - u along world x
+        np.testing.assert_allclose(tangent[quad] / np.linalg.norm(tangent[quad], axis=1, keepdims=True), [[direction, 0., 0.]] * quad.sum(), atol=1e-6)
+    bitangents = shader_data["tangent"][:, 3:] * np.cross(shader_data["normal"], tangent)
+    np.testing.assert_allclose(bitangents / np.linalg.norm(bitangents, axis=1, keepdims=True), [[0., -1., 0.]] * len(points), atol=1e-6)
+
+def test_mirroring_the_model_flips_handedness(tmp_path):
+    path = str(tmp_path / "quads.obj")
+    make_mirrored_mesh().export(path)
+    model = ModelPBR(path, use_mesh_cache=False)
+    handedness = model.get_handedness().copy()
+    model.rotate(1.0).shift([1., 2., 3.]).flip() # flip() is a half turn, not a mirroring
+    np.testing.assert_array_equal(model.get_handedness(), handedness)
+    model.stretch(-1, dim=0)
+    np.testing.assert_array_equal(model.get_handedness(), -handedness)